@@ -0,0 +1,248 @@
+"""
+Retry policy for requests to the public kraken api
+--> state is kept per endpoint and pair, so one bad pair doesn't affect
+    the others
+--> adaptive backoff: the delay grows with the consecutive failures of
+    an endpoint/pair (across calls), with full jitter so that workers
+    don't retry in lockstep
+--> circuit breaker: after failure_threshold consecutive failures the
+    endpoint/pair is considered down and calls fail fast for
+    reset_seconds, then a single probe call decides whether it is up again
+--> blocking: retries wait in the calling thread within a time budget
+    covering the attempts and the waiting, capped by the deadline of the
+    caller. Non-blocking: a failed call is not retried, calls before the
+    backoff delay has passed are rejected with RetryLaterError. Sequential
+    loops use this to skip a failing pair for an iteration instead of
+    delaying all other pairs
+"""
+import time
+import random
+import logging
+import threading
+
+import metrics
+
+#### setup
+logger = logging.getLogger(__name__)
+RETRIES = metrics.REGISTRY.counter(
+    "arthur_request_retries_total", "Retries triggered after failed requests"
+)
+RETRY_WAIT = metrics.REGISTRY.counter(
+    "arthur_retry_wait_seconds_total", "Time spent waiting between retries"
+)
+CIRCUIT_EVENTS = metrics.REGISTRY.counter(
+    "arthur_circuit_events_total", "Circuit breaker openings and rejected calls"
+)
+
+
+class TransientError(Exception):
+    """
+    Retryable failure, response holds the error response of the api
+    """
+
+    def __init__(self, response: dict):
+        super().__init__(response.get("error"))
+        self.response = response
+
+
+class CircuitOpenError(Exception):
+    """
+    Call rejected without a request because the endpoint is down
+    """
+
+
+class DeadlineExceeded(Exception):
+    """
+    Call rejected without a request because its time budget is used up
+    """
+
+
+class RetryLaterError(Exception):
+    """
+    Call rejected without a request because the backoff delay after the
+    last failure hasn't passed yet (non-blocking policy)
+    """
+
+
+class _EndpointState:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.consecutive_failures = 0
+        self.opened_at = None  # None: circuit closed
+        self.probing = False
+        self.retry_at = None  # non-blocking: no call before this time
+        self.wait_seconds = 0.0
+        self.retries = 0
+        self.rejections = 0
+
+
+class RetryPolicy:
+    def __init__(
+        self,
+        base_seconds: float = 0.25,
+        max_seconds: float = 8,
+        max_attempts: int = 5,
+        max_call_seconds: float = 5,
+        failure_threshold: int = 10,
+        reset_seconds: float = 30,
+        retry_on: tuple = (TransientError,),
+        blocking: bool = True,
+        time_fn=time.monotonic,
+        sleep_fn=time.sleep,
+        seed: int = None,
+    ):
+        """
+        base_seconds, max_seconds: the delay before a retry is drawn
+            uniformly from [0, min(max_seconds, base_seconds * 2**n)] with n
+            consecutive failures of the endpoint
+        max_attempts, max_call_seconds: limits of one call (attempts and
+            waiting), the last exception is raised once one of them would
+            be exceeded
+        failure_threshold, reset_seconds: circuit breaker settings
+        retry_on: exception types that count as failure of the endpoint,
+            other exceptions are raised immediately
+        blocking: retry within the call, otherwise the failure is raised
+            and the retry is left to the next call after the delay
+        """
+        self.base_seconds = base_seconds
+        self.max_seconds = max_seconds
+        self.max_attempts = max_attempts
+        self.max_call_seconds = max_call_seconds
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.retry_on = retry_on
+        self.blocking = blocking
+        self.time_fn = time_fn
+        self.sleep_fn = sleep_fn
+        self.rng = random.Random(seed)
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def _state(self, endpoint: str, pair: str = None) -> _EndpointState:
+        key = (endpoint, pair)
+        with self._lock:
+            if key not in self._states:
+                self._states[key] = _EndpointState()
+            return self._states[key]
+
+    def call(self, endpoint: str, fn, deadline: float = None, pair: str = None):
+        """
+        Return fn(timeout=remaining seconds of the budget), retried on
+        failures according to the policy. The budget ends after
+        max_call_seconds or at deadline (time_fn clock), whichever is first.
+        Raises CircuitOpenError if the endpoint is down, DeadlineExceeded
+        if the deadline has passed before the first attempt and
+        RetryLaterError while a non-blocking policy backs off
+        """
+        state = self._state(endpoint, pair)
+        end = self.time_fn() + self.max_call_seconds
+        if deadline is not None:
+            end = min(end, deadline)
+        for attempt in range(1, self.max_attempts + 1):
+            remaining = end - self.time_fn()
+            if remaining <= 0:
+                raise DeadlineExceeded(f"{endpoint}: no time left for a request")
+            self._admit(endpoint, state)
+            try:
+                result = fn(timeout=remaining)
+            except self.retry_on:
+                delay = self._record_failure(endpoint, state)
+                if not self.blocking:
+                    with state.lock:
+                        state.retry_at = self.time_fn() + delay
+                        state.retries += 1
+                        state.wait_seconds += delay
+                    RETRIES.inc(endpoint=endpoint)
+                    RETRY_WAIT.inc(delay, endpoint=endpoint)
+                    raise
+                if (
+                    attempt == self.max_attempts
+                    or state.opened_at is not None
+                    or self.time_fn() + delay >= end
+                ):
+                    raise
+            except BaseException:
+                # not a failure of the endpoint, but let the next call probe
+                with state.lock:
+                    state.probing = False
+                raise
+            else:
+                self._record_success(state)
+                return result
+
+            logger.debug(f"{endpoint}: attempt {attempt} failed, retry in {delay:.2f}s")
+            RETRIES.inc(endpoint=endpoint)
+            RETRY_WAIT.inc(delay, endpoint=endpoint)
+            with state.lock:
+                state.retries += 1
+                state.wait_seconds += delay
+            self.sleep_fn(delay)
+
+    def _admit(self, endpoint: str, state: _EndpointState) -> None:
+        """
+        Raise CircuitOpenError unless the circuit is closed or this call
+        is the probe of a half open circuit. Raise RetryLaterError before
+        the scheduled retry of a non-blocking policy
+        """
+        with state.lock:
+            if state.opened_at is None:
+                if state.retry_at is not None and self.time_fn() < state.retry_at:
+                    state.rejections += 1
+                    raise RetryLaterError(f"{endpoint} backs off after a failure")
+                return None
+            if (
+                not state.probing
+                and self.time_fn() - state.opened_at >= self.reset_seconds
+            ):
+                state.probing = True
+                return None
+            state.rejections += 1
+        CIRCUIT_EVENTS.inc(endpoint=endpoint, event="rejected")
+        raise CircuitOpenError(f"{endpoint} is unavailable, circuit open")
+
+    def _record_failure(self, endpoint: str, state: _EndpointState) -> float:
+        """
+        Count the failure, open the circuit if necessary and return the
+        delay before the next attempt
+        """
+        with state.lock:
+            state.consecutive_failures += 1
+            was_probe, state.probing = state.probing, False
+            if was_probe or (
+                state.opened_at is None
+                and state.consecutive_failures >= self.failure_threshold
+            ):
+                state.opened_at = self.time_fn()
+                opened = True
+            else:
+                opened = False
+            cap = min(
+                self.max_seconds,
+                self.base_seconds * 2 ** min(state.consecutive_failures - 1, 32),
+            )
+        if opened:
+            CIRCUIT_EVENTS.inc(endpoint=endpoint, event="opened")
+            logger.warning(f"{endpoint}: circuit opened after repeated failures")
+        return self.rng.uniform(0, cap)
+
+    def _record_success(self, state: _EndpointState) -> None:
+        with state.lock:
+            state.consecutive_failures = 0
+            state.opened_at = None
+            state.probing = False
+            state.retry_at = None
+        return None
+
+    def stats(self, endpoint: str, pair: str = None) -> dict:
+        """
+        Retries, waiting time, rejected calls and circuit state of endpoint
+        """
+        state = self._state(endpoint, pair)
+        with state.lock:
+            return dict(
+                retries=state.retries,
+                wait_seconds=state.wait_seconds,
+                rejections=state.rejections,
+                consecutive_failures=state.consecutive_failures,
+                circuit_open=state.opened_at is not None,
+            )
@@ -3,7 +3,30 @@ Contains shadow trading engine
 --> class to keep track of order, trades and pnl
 """
 
+import os
+import copy
+import logging
 import numpy as np
+from collections import deque
+
+import metrics
+import profiling
+from performance import StreamingPerformance
+
+#### setup
+logger = logging.getLogger(__name__)
+STALE_SKIPS = metrics.REGISTRY.counter(
+    "arthur_stale_rebalance_skips_total", "Rebalances refused on stale books"
+)
+
+# fixed size record of one fill in the order log
+ORDER_LOG_DTYPE = [
+    ("order_id", "S32"),
+    ("side", "i1"),  # 1: buy, -1: sell
+    ("trade_price", "f8"),
+    ("volume", "f8"),
+    ("cashflow", "f8"),
+]
 
 
 class Order:
@@ -24,6 +47,19 @@ class Order:
         factor = 1 if self.side == "sell" else -1
         return self.trade_price * self.volume * factor
 
+    def to_record(self) -> tuple:
+        """
+        Order as row of the binary order log
+        """
+        side = 1 if self.side == "buy" else -1
+        return (
+            str(self.order_id).encode()[:32],
+            side,
+            self.trade_price,
+            self.volume,
+            self.get_cashflow(),
+        )
+
     def __format__(self, format_spec):
         return f"{self.side} {self.volume}@{self.trade_price}".__format__(format_spec)
 
@@ -34,22 +70,72 @@ class Backtest:
     todo: add transaction costs
     """
 
-    def __init__(self):
+    # attributes that are written to / restored from a checkpoint
+    _state_attrs = (
+        "current_position",
+        "cashflows",
+        "turnover",
+        "all_orders",
+        "total_cashflow",
+        "total_turnover",
+        "n_orders",
+        "n_spilled",
+        "performance",
+        "last_order_book",
+    )
+
+    def __init__(
+        self,
+        max_orders: int = None,
+        order_log_path: str = None,
+        periods_per_year: float = None,
+    ):
+        """
+        max_orders: number of most recent fills kept in memory (newest
+            first in cashflows, turnover and all_orders). Older fills are
+            appended to the binary file order_log_path if given, else dropped.
+            pnl and turnover stay exact through running totals
+        periods_per_year: annualization of Sharpe/Sortino, see
+            performance.StreamingPerformance
+        """
+        self.max_orders = max_orders
+        self.order_log_path = order_log_path
         self.current_position = 0
-        self.cashflows = []
-        self.turnover = []
-        self.all_orders = []
+        self.cashflows = deque(maxlen=max_orders)
+        self.turnover = deque(maxlen=max_orders)
+        self.all_orders = deque(maxlen=max_orders)
+        self.total_cashflow = 0.0
+        self.total_turnover = 0.0
+        self.n_orders = 0
+        self.n_spilled = 0
+        self.stale_skips = 0
+        self.performance = StreamingPerformance(periods_per_year=periods_per_year)
         self.open_orders = {}
         self.market_state = {}
+        self.last_order_book = None
 
+    @profiling.timed
     def rebalance_position(self, desired_position: int):
         """
         Execute an order to change position from 
-        current position to desired position
+        current position to desired position.
+        Refused if the order book is missing or marked as stale
         """
         volume_to_trade = desired_position - self.current_position
+        if volume_to_trade != 0 and not self.has_fresh_book():
+            logger.warning("Order book is stale, not rebalancing")
+            self.stale_skips += 1
+            STALE_SKIPS.inc()
+            return None
         if volume_to_trade != 0:
-            self._execute_order(volume_to_trade)
+            cashflow_before = self.total_cashflow
+            trade_price = self._execute_order(volume_to_trade)
+            self.performance.on_fill(
+                old_position=self.current_position,
+                new_position=desired_position,
+                price=trade_price,
+                cashflow=cashflow_before,
+            )
             self.current_position = desired_position
         pass
 
@@ -73,35 +159,155 @@ class Backtest:
         cashflow = order.get_cashflow()
 
         # update state
-        self.cashflows.insert(0, cashflow)
-        self.turnover.insert(0, np.abs(volume))
-        self.all_orders.insert(0, order)
-        pass
+        if self.max_orders is not None and len(self.all_orders) == self.max_orders:
+            self._spill_order(self.all_orders[-1])
+        self.cashflows.appendleft(cashflow)
+        self.turnover.appendleft(np.abs(volume))
+        self.all_orders.appendleft(order)
+        self.total_cashflow += cashflow
+        self.total_turnover += np.abs(volume)
+        self.n_orders += 1
+        return trade_price
+
+    def _spill_order(self, order: Order) -> None:
+        """
+        Append the oldest in-memory fill to the order log before it is
+        evicted from memory
+        """
+        if self.order_log_path is not None:
+            with open(self.order_log_path, "ab") as f:
+                np.array([order.to_record()], dtype=ORDER_LOG_DTYPE).tofile(f)
+        self.n_spilled += 1
+        return None
+
+    def read_order_log(self) -> np.array:
+        """
+        Fills which were moved out of memory (oldest first) as read-only
+        memory mapped array
+        """
+        if self.order_log_path is None or not os.path.exists(self.order_log_path):
+            return np.empty(0, dtype=ORDER_LOG_DTYPE)
+        if os.path.getsize(self.order_log_path) == 0:
+            return np.empty(0, dtype=ORDER_LOG_DTYPE)
+        return np.memmap(self.order_log_path, dtype=ORDER_LOG_DTYPE, mode="r")
+
+    def get_order_history(self) -> np.array:
+        """
+        All fills (oldest first) from the order log and memory. Without an
+        order log, fills evicted from memory are missing
+        """
+        in_memory = np.array(
+            [order.to_record() for order in reversed(self.all_orders)],
+            dtype=ORDER_LOG_DTYPE,
+        )
+        return np.concatenate([self.read_order_log(), in_memory])
 
     def update_market_state(self, market_state: dict) -> None:
         """
         Current market context. Contains order book information
-        as well as recent trades
+        as well as recent trades. The open position is marked to market
+        for the performance statistics
         """
         self.market_state = market_state
+        if market_state.get("order_book") is not None:
+            self.last_order_book = market_state["order_book"]
+            self.performance.on_tick(
+                equity=self.get_current_profit(),
+                position=self.current_position,
+                timestamp=market_state.get("timestamp"),
+            )
         return None
 
+    def has_fresh_book(self) -> bool:
+        """
+        True if the current market state has an order book that is not stale
+        """
+        order_book = self.market_state.get("order_book")
+        stale = self.market_state.get("stale", ())
+        return order_book is not None and "order_book" not in stale
+
     def get_current_profit(self) -> float:
         """
         Current pnl
         """
-        return np.sum(self.cashflows) + self.current_position_value()
+        return self.total_cashflow + self.current_position_value()
+
+    def get_performance(self) -> dict:
+        """
+        Running drawdown, Sharpe/Sortino, round trip and exposure statistics
+        """
+        return self.performance.summary()
+
+    def get_total_turnover(self) -> float:
+        """
+        Total traded volume
+        """
+        return self.total_turnover
 
     def current_position_value(self) -> float:
         """
-        Valuation of current open position based on current NBBO
+        Valuation of current open position based on current NBBO. If the
+        current market state has no order book, the last one received is
+        used, else the price of the last fill (e.g. restored from an old
+        checkpoint), nan if there is neither
         """
-        if self.current_position > 0:
-            return self.current_position * self.market_state["order_book"].best_bid
-        elif self.current_position < 0:
-            return self.current_position * self.market_state["order_book"].best_ask
-        else:
+        order_book = self.market_state.get("order_book")
+        if order_book is None:
+            order_book = self.last_order_book
+        if self.current_position == 0:
             return 0
+        elif order_book is None:
+            last_order = self.all_orders[0] if self.all_orders else None
+            return self.current_position * getattr(last_order, "trade_price", np.nan)
+        elif self.current_position > 0:
+            return self.current_position * order_book.best_bid
+        else:
+            return self.current_position * order_book.best_ask
+
+    def get_state(self) -> dict:
+        """
+        Copy of position and ledger needed for a warm restart
+        """
+        return {attr: copy.deepcopy(getattr(self, attr)) for attr in self._state_attrs}
+
+    def set_state(self, state: dict) -> None:
+        """
+        Restore state created by get_state
+        """
+        for attr in self._state_attrs:
+            if attr in state:
+                setattr(self, attr, copy.deepcopy(state[attr]))
+        if "total_cashflow" not in state:
+            # checkpoints written before the running totals existed keep
+            # all fills in memory
+            self.total_cashflow = float(sum(self.cashflows))
+            self.total_turnover = float(sum(self.turnover))
+            self.n_orders = len(self.all_orders)
+            self.n_spilled = 0
+        self._truncate_order_log()
+
+        # checkpoint may hold more fills than this instance keeps in memory
+        orders = list(self.all_orders)
+        if self.max_orders is not None:
+            for order in reversed(orders[self.max_orders :]):
+                self._spill_order(order)
+        for attr in ("cashflows", "turnover", "all_orders"):
+            items = list(getattr(self, attr))[: self.max_orders]
+            setattr(self, attr, deque(items, maxlen=self.max_orders))
+        return None
+
+    def _truncate_order_log(self) -> None:
+        """
+        Drop fills that were logged after the restored checkpoint was
+        written, they would otherwise be counted twice
+        """
+        if self.order_log_path is None or not os.path.exists(self.order_log_path):
+            return None
+        size = self.n_spilled * np.dtype(ORDER_LOG_DTYPE).itemsize
+        if os.path.getsize(self.order_log_path) > size:
+            with open(self.order_log_path, "r+b") as f:
+                f.truncate(size)
+        return None
 
     def get_last_order(self):
         """
@@ -0,0 +1,115 @@
+"""
+Local estimate of the Kraken server clock
+--> sample the Time endpoint occasionally and serve corrected
+    timestamps without a network call
+"""
+import time
+import logging
+from collections import deque
+
+import kraken_client
+
+#### setup
+logger = logging.getLogger(__name__)
+
+#### constants
+RFC1123_FMT = "%a, %d %b %y %H:%M:%S +0000"  # format used by kraken
+
+
+class ServerClock:
+    """
+    NTP style offset estimation: for every sample the local send (t0) and
+    receive (t1) time is recorded. Kraken reports whole seconds, so the
+    server time lies in [unixtime, unixtime + 1) and each sample bounds
+    the offset to [unixtime - t1, unixtime + 1 - t0]. The intersection of
+    the recent samples narrows the offset, the estimate is its midpoint
+    """
+
+    def __init__(
+        self,
+        resync_seconds: float = 300,
+        n_samples: int = 8,
+        time_fn=time.time,
+        retry_seconds: float = 5,
+    ):
+        """
+        resync_seconds: interval between successful syncs
+        retry_seconds: interval between attempts after a failed sync
+        """
+        self.resync_seconds = resync_seconds
+        self.retry_seconds = retry_seconds
+        self.time_fn = time_fn
+        self._samples = deque(maxlen=n_samples)
+        self._last_sync = None
+        self._last_attempt = None
+        self.offset = 0.0
+        self.delay = None
+
+    @property
+    def is_synced(self) -> bool:
+        return bool(self._samples)
+
+    def sync(self) -> bool:
+        """
+        Take one sample from the Time endpoint and update the offset
+        """
+        t0 = self.time_fn()
+        _, server_unix = kraken_client.get_server_time()
+        t1 = self.time_fn()
+        self._last_attempt = time.monotonic()
+
+        if server_unix is None:
+            logger.warning("Clock sync failed, keeping previous offset")
+            return False
+
+        self._last_sync = self._last_attempt
+        self._samples.append((server_unix - t1, server_unix + 1 - t0, t1 - t0))
+        self.offset, self.delay = self._estimate()
+        logger.debug(f"Clock offset {self.offset:.3f}s, delay {self.delay:.3f}s")
+        return True
+
+    def _estimate(self) -> tuple:
+        """
+        Offset and round trip delay from the recent samples
+        """
+        lower = max(s[0] for s in self._samples)
+        upper = min(s[1] for s in self._samples)
+        if lower > upper:
+            # samples contradict each other (e.g. local clock was stepped)
+            # --> start over with the latest sample only
+            latest = self._samples[-1]
+            self._samples.clear()
+            self._samples.append(latest)
+            lower, upper = latest[0], latest[1]
+        delay = min(s[2] for s in self._samples)
+        return (lower + upper) / 2, delay
+
+    def maybe_sync(self) -> None:
+        """
+        Resync if the clock was never synced or the last sync is too old,
+        failed syncs are retried after retry_seconds
+        """
+        now = time.monotonic()
+        if (
+            self._last_attempt is not None
+            and now - self._last_attempt < self.retry_seconds
+        ):
+            return None
+        if self._last_sync is None or now - self._last_sync > self.resync_seconds:
+            self.sync()
+        return None
+
+    def now(self) -> float:
+        """
+        Current exchange time as unix timestamp
+        """
+        self.maybe_sync()
+        return self.time_fn() + self.offset
+
+    def rfc1123(self, timestamp: float = None) -> str:
+        """
+        Exchange time formatted like the rfc1123 field of the Time endpoint
+        """
+        if timestamp is None:
+            timestamp = self.now()
+        return time.strftime(RFC1123_FMT, time.gmtime(timestamp))
@@ -1,17 +1,67 @@
 """
 Class to distribute and preprocess market data
 """
+import time
+import logging
 import numpy as np
 import kraken_client
+import metrics
+import profiling
 import utils
+from clock import ServerClock
+
+#### setup
+logger = logging.getLogger(__name__)
+STALE_COMPONENTS = metrics.REGISTRY.counter(
+    "arthur_stale_components_total", "Snapshot components older than max_staleness"
+)
 
 
 class DataCenter:
-    def __init__(self, pair, load_trades: bool = True, load_orderbook: bool = True):
+    def __init__(
+        self,
+        pair,
+        load_trades: bool = True,
+        load_orderbook: bool = True,
+        book_depth: int = None,
+        clock: ServerClock = None,
+        max_staleness: float = None,
+        drop_stale: bool = False,
+        trade_buffer_size: int = None,
+    ):
+        """
+        book_depth: if given, the order book is parsed into fixed-capacity
+            buffers of this many levels per side which are reused for every
+            update. The returned OrderBook is then a view that changes with
+            the next update --> use OrderBook.snapshot() to retain it
+        clock: estimate of the exchange clock used to timestamp snapshots,
+            can be shared between several DataCenters
+        max_staleness: components (order_book, public_trades) received more
+            than this many seconds before the snapshot time are listed in
+            the 'stale' entry of the market data, and set to None if
+            drop_stale is True
+        trade_buffer_size: if given (and load_trades), individual trades
+            are accumulated across updates through the since cursor of the
+            Trades endpoint in a TradeBuffer of this capacity, available as
+            public_trades.trades
+        """
         self.pair = pair
-        self.load_server_time = True
+        self.clock = clock if clock is not None else ServerClock()
+        self.max_staleness = max_staleness
+        self.drop_stale = drop_stale
         self.load_trades = load_trades
         self.load_orderbook = load_orderbook
+        self.book_depth = book_depth
+        self.trade_buffer = None
+        self._trades_cursor = None
+        if trade_buffer_size is not None:
+            self.trade_buffer = TradeBuffer(capacity=trade_buffer_size)
+        self._book_columns = None
+        if book_depth is not None:
+            self._book_columns = (
+                allocate_book_columns(book_depth),
+                allocate_book_columns(book_depth),
+            )
         self.init_empty_market_vars()
 
     def init_empty_market_vars(self) -> None:
@@ -19,46 +69,221 @@ class DataCenter:
         Initiate empty market information
         """
         self.server_time_rfc = None
+        self.server_time_unix = None
         self.order_book = None
         self.public_trades = None
+        # exchange time at which each component was fetched from the api
+        self.component_times = dict(order_book=None, public_trades=None)
 
-    def update_market_data(self) -> None:
+    @profiling.timed
+    def update_market_data(self, deadline: float = None) -> None:
         """
-        Load most recent data from Kraken
+        Load most recent data from Kraken. Components that can't be loaded
+        keep their previous value (and receive time). Requests are not
+        sent or retried after the deadline (time.monotonic)
         """
 
-        if self.load_server_time:
-            # krakens server time
-            self.server_time_rfc, _ = kraken_client.get_server_time()
-
-        if self.load_orderbook:
+        if self.load_orderbook and not _is_past(deadline):
             # orderbook: dict with ask/bid information - asks and bids are arrays
-            _, bids, asks = kraken_client.get_orderbook(pair=self.pair)
-            self.order_book = OrderBook(bids=bids, asks=asks)
+            _, bids, asks = kraken_client.get_orderbook(
+                pair=self.pair,
+                count=self.book_depth,
+                out=self._book_columns,
+                deadline=deadline,
+            )
+            if bids is not None:
+                if self._book_columns is not None and self.order_book is not None:
+                    # reuse the existing object, only the views change
+                    self.order_book.bids, self.order_book.asks = bids, asks
+                else:
+                    self.order_book = OrderBook(bids=bids, asks=asks)
+                self.component_times["order_book"] = self._fetch_time()
 
-        if self.load_trades:
-            ohlc = kraken_client.get_ohlc(pair=self.pair, interval=1)
-            self.public_trades = PublicTrades(ohlc=ohlc)
+        if self.load_trades and not _is_past(deadline):
+            ohlc = kraken_client.get_ohlc(pair=self.pair, interval=1, deadline=deadline)
+            ohlc_time = self._fetch_time()
+            if self.trade_buffer is not None:
+                trades, self._trades_cursor = kraken_client.get_lasttrades(
+                    pair=self.pair, since=self._trades_cursor, deadline=deadline
+                )
+                if trades is not None:
+                    self.trade_buffer.extend(trades)
+            if ohlc is not None:
+                self.public_trades = PublicTrades(ohlc=ohlc, trades=self.trade_buffer)
+                self.component_times["public_trades"] = ohlc_time
 
+        # krakens server time, estimated locally without a request
+        self.server_time_unix = self.clock.now()
+        self.server_time_rfc = self.clock.rfc1123(self.server_time_unix)
         return None
 
-    def get_market_data(self):
+    def _fetch_time(self) -> float:
+        """
+        Exchange time at which the last response was fetched, earlier than
+        now if it was served from the response cache
+        """
+        return self.clock.now() - kraken_client.last_response_age()
+
+    def get_market_data(self, deadline: float = None):
         """
         Return most recent data
         """
-        self.update_market_data()
-        return dict(
+        self.update_market_data(deadline=deadline)
+        market_data = dict(
             time=self.server_time_rfc,
+            timestamp=self.server_time_unix,
             order_book=self.order_book,
             public_trades=self.public_trades,
+            received=dict(self.component_times),
+            stale=self.get_stale_components(),
         )
+        if self.drop_stale:
+            for component in market_data["stale"]:
+                market_data[component] = None
+        return market_data
+
+    def get_stale_components(self) -> tuple:
+        """
+        Loaded components which were received more than max_staleness
+        seconds before the snapshot time or never
+        """
+        if self.max_staleness is None:
+            return ()
+        loaded = dict(order_book=self.load_orderbook, public_trades=self.load_trades)
+        stale = tuple(
+            component
+            for component, received in self.component_times.items()
+            if loaded[component]
+            and (
+                received is None
+                or self.server_time_unix - received > self.max_staleness
+            )
+        )
+        for component in stale:
+            STALE_COMPONENTS.inc(pair=self.pair, component=component)
+        return stale
+
+
+def _is_past(deadline: float) -> bool:
+    return deadline is not None and time.monotonic() > deadline
+
+
+class MultiPairDataCenter:
+    """
+    Market data for many pairs. Best bid/ask/last of all pairs come from
+    one Ticker request, the full order book is only loaded for depth_pairs
+    """
+
+    def __init__(
+        self,
+        pairs: list,
+        depth_pairs: list = (),
+        load_trades: bool = True,
+        book_depth: int = None,
+        clock: ServerClock = None,
+    ):
+        self.pairs = list(pairs)
+        self.clock = clock if clock is not None else ServerClock()
+        self.load_trades = load_trades
+        self.ticker_pairs = [pair for pair in self.pairs if pair not in depth_pairs]
+        self._depth_centers = {
+            pair: DataCenter(
+                pair, load_trades=load_trades, book_depth=book_depth, clock=self.clock
+            )
+            for pair in self.pairs
+            if pair in depth_pairs
+        }
+        self.quotes = None
+        # last ohlc of every ticker pair, kept if a request fails
+        self.public_trades = {}
+
+    @classmethod
+    def from_strategies(cls, strategies: dict, **kwargs) -> "MultiPairDataCenter":
+        """
+        strategies: dict pair -> Strategy. The full order book is loaded
+        only for pairs whose strategy requires it
+        """
+        depth_pairs = [
+            pair for pair, strategy in strategies.items() if strategy.requires_depth
+        ]
+        return cls(pairs=list(strategies), depth_pairs=depth_pairs, **kwargs)
+
+    def get_market_data(self, deadline: float = None) -> dict:
+        """
+        Return most recent data as dict pair -> market data. Requests are
+        not sent or retried after the deadline (time.monotonic), pairs
+        without fresh data are marked stale
+        """
+        market_data = {}
+        if self.ticker_pairs:
+            # one row per pair: pair, bid, ask, last
+            self.quotes = kraken_client.get_ticker(self.ticker_pairs, deadline=deadline)
+            server_time_unix = self.clock.now()
+            server_time_rfc = self.clock.rfc1123(server_time_unix)
+            for i, pair in enumerate(self.ticker_pairs):
+                stale = ()
+                if self.load_trades:
+                    ohlc = None
+                    if not _is_past(deadline):
+                        ohlc = kraken_client.get_ohlc(
+                            pair=pair, interval=1, deadline=deadline
+                        )
+                    if ohlc is not None:
+                        self.public_trades[pair] = PublicTrades(ohlc=ohlc)
+                    else:
+                        stale += ("public_trades",)
+                order_book = None
+                if self.quotes is not None and not np.isnan(
+                    [self.quotes["bid"][i], self.quotes["ask"][i]]
+                ).any():
+                    order_book = TopOfBook(
+                        best_bid=self.quotes["bid"][i],
+                        best_ask=self.quotes["ask"][i],
+                        last_price=self.quotes["last"][i],
+                    )
+                else:
+                    # no quote for this pair in the response
+                    stale = ("order_book",) + stale
+                market_data[pair] = dict(
+                    time=server_time_rfc,
+                    timestamp=server_time_unix,
+                    order_book=order_book,
+                    public_trades=self.public_trades.get(pair),
+                    stale=stale,
+                )
+
+        for pair, data_center in self._depth_centers.items():
+            market_data[pair] = data_center.get_market_data(deadline=deadline)
+        return market_data
+
+
+def allocate_book_columns(depth: int) -> dict:
+    """
+    Fixed-capacity column buffers for one side of the order book
+    """
+    return dict(
+        price=np.zeros(depth, dtype=np.float64),
+        volume=np.zeros(depth, dtype=np.float64),
+        timestamp=np.zeros(depth, dtype=np.int64),
+    )
 
 
 class OrderBook:
     def __init__(self, bids: np.array, asks: np.array):
+        """
+        bids/asks: structured arrays or dicts of column arrays with
+            price, volume and timestamp, sorted best price first
+        """
         self.bids = bids
         self.asks = asks
 
+    def snapshot(self) -> "OrderBook":
+        """
+        Copy of the order book which owns its data. Use this to retain
+        a book that is backed by reused buffers
+        """
+        return OrderBook(bids=_copy_book_side(self.bids), asks=_copy_book_side(self.asks))
+
     @property
     def midprice(self) -> float:
         """
@@ -113,9 +338,42 @@ class OrderBook:
         return obwa_price
 
 
+def _copy_book_side(side) -> np.array:
+    """
+    Copy one side of the order book into a new structured array
+    """
+    arr = np.empty(len(side["price"]), dtype=kraken_client.ORDERBOOK_DTYPE)
+    for name in arr.dtype.names:
+        arr[name] = side[name]
+    return arr
+
+
+class TopOfBook:
+    """
+    Best bid/ask of a pair without the order book levels. Provides the
+    parts of the OrderBook interface that only need the top of book
+    """
+
+    def __init__(self, best_bid: float, best_ask: float, last_price: float = None):
+        self.best_bid = best_bid
+        self.best_ask = best_ask
+        self.last_price = last_price
+
+    @property
+    def midprice(self) -> float:
+        """
+        Midprice = mean(best_bid, best_ask)
+        """
+        return np.mean([self.best_ask, self.best_bid])
+
+    def snapshot(self) -> "TopOfBook":
+        return self
+
+
 class PublicTrades:
-    def __init__(self, ohlc: np.array):
+    def __init__(self, ohlc: np.array, trades: "TradeBuffer" = None):
         self._ohlc = ohlc
+        self.trades = trades
 
     @property
     def ohlc(self) -> np.array:
@@ -128,4 +386,84 @@ class PublicTrades:
         --> last traded price
         """
         idx = np.argmax(self._ohlc["timestamp"])
-        return self._ohlc["close"][idx]
\ No newline at end of file
+        return self._ohlc["close"][idx]
+
+
+class TradeBuffer:
+    """
+    Most recent individual trades (kraken_client.TRADES_DTYPE), oldest
+    first. Storage has twice the capacity, so trades are appended at the
+    end and only moved once per capacity trades --> amortized O(1) per
+    trade and the buffer is always a contiguous array
+    """
+
+    def __init__(self, capacity: int = 10000):
+        self.capacity = capacity
+        self._buffer = np.zeros(2 * capacity, dtype=kraken_client.TRADES_DTYPE)
+        self._start = 0
+        self._end = 0
+
+    def __len__(self) -> int:
+        return self._end - self._start
+
+    def __getstate__(self) -> dict:
+        # only the buffered trades, not the preallocated storage
+        return dict(capacity=self.capacity, trades=self.trades.copy())
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(capacity=state["capacity"])
+        self.extend(state["trades"])
+        return None
+
+    @property
+    def trades(self) -> np.array:
+        """
+        View on the buffered trades, changes with the next extend
+        """
+        return self._buffer[self._start : self._end]
+
+    def extend(self, trades: np.array) -> None:
+        """
+        Append trades (sorted by time), the oldest ones beyond the
+        capacity are dropped
+        """
+        trades = trades[-self.capacity :]
+        n = len(trades)
+        if self._end + n > len(self._buffer):
+            keep = min(len(self), self.capacity - n)
+            self._buffer[:keep] = self._buffer[self._end - keep : self._end]
+            self._start, self._end = 0, keep
+        self._buffer[self._end : self._end + n] = trades
+        self._end += n
+        self._start = max(self._start, self._end - self.capacity)
+        return None
+
+    def window(self, seconds: float, now: float = None) -> np.array:
+        """
+        Trades of the last seconds before now (default: time of the
+        latest trade)
+        """
+        trades = self.trades
+        if not len(trades):
+            return trades
+        if now is None:
+            now = trades["timestamp"][-1]
+        first = np.searchsorted(trades["timestamp"], now - seconds, side="right")
+        return trades[first:]
+
+    def signed_volume(self, seconds: float, now: float = None) -> float:
+        """
+        Buy volume minus sell volume within the window
+        """
+        trades = self.window(seconds, now)
+        return float(np.dot(trades["direction"], trades["volume"]))
+
+    def vwap(self, seconds: float, now: float = None) -> float:
+        """
+        Volume weighted average trade price within the window
+        """
+        trades = self.window(seconds, now)
+        volume = trades["volume"].sum()
+        if volume == 0:
+            return np.nan
+        return float(np.dot(trades["price"], trades["volume"]) / volume)
@@ -0,0 +1,363 @@
+"""
+Walk-forward and bootstrap evaluation of strategy configurations on
+recorded market data (see persistence.record_market_state)
+--> rolling train/test windows: parameters are picked on the train window
+    and scored out of sample on the following test window through Backtest
+--> block bootstrap of the out-of-sample per-interval pnl, resampled in
+    vectorized batches
+--> windows and bootstrap batches are spread over a process pool
+"""
+import math
+import logging
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import persistence
+from backtest import Backtest
+from performance import SECONDS_PER_YEAR
+
+#### setup
+logger = logging.getLogger(__name__)
+
+#### constants
+BOOTSTRAP_PERCENTILES = (5, 50, 95)
+
+
+#### functions
+def param_combinations(param_grid: dict) -> list:
+    """
+    All parameter dicts of a grid {name: list of values}
+    """
+    names = list(param_grid)
+    return [
+        dict(zip(names, values))
+        for values in itertools.product(*(param_grid[name] for name in names))
+    ]
+
+
+def walk_forward_windows(
+    n_records: int, train_size: int, test_size: int, step: int = None
+) -> list:
+    """
+    (train_start, train_end, test_end) of rolling windows, the test window
+    is [train_end, test_end). By default the windows don't overlap out of
+    sample (step = test_size)
+    """
+    step = test_size if step is None else step
+    return [
+        (start, start + train_size, start + train_size + test_size)
+        for start in range(0, n_records - train_size - test_size + 1, step)
+    ]
+
+
+def run_backtest(
+    strategy_cls, params: dict, history: list, warmup: list = None
+) -> np.array:
+    """
+    Trade the strategy on the recorded snapshots and return the pnl change
+    of every interval. Snapshots in warmup only fill the strategy windows
+    """
+    strategy = strategy_cls(**params)
+    engine = Backtest()
+    if warmup:
+        strategy.prefill(warmup)
+
+    pnl = np.zeros(len(history))
+    for i, market_state in enumerate(history):
+        desired_position = engine.current_position
+        if not market_state.get("stale"):
+            strategy.update_market_state(current_state=market_state)
+            desired_position = strategy.desired_position
+        engine.update_market_state(market_state)
+        engine.rebalance_position(desired_position)
+        pnl[i] = engine.get_current_profit()
+    return np.diff(pnl, prepend=0.0)
+
+
+def sharpe_ratio(pnl: np.array, periods_per_year: float = None) -> np.array:
+    """
+    Sharpe ratio of per-interval pnl along the last axis, annualized if
+    periods_per_year is given
+    """
+    std = pnl.std(axis=-1, ddof=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sharpe = np.where(std > 0, pnl.mean(axis=-1) / std, np.nan)
+    return sharpe * math.sqrt(periods_per_year or 1)
+
+
+def max_drawdown(pnl: np.array) -> np.array:
+    """
+    Maximum drawdown of the cumulative pnl along the last axis, measured
+    from the running peak like performance.StreamingPerformance
+    """
+    equity = np.cumsum(pnl, axis=-1)
+    peak = np.maximum.accumulate(equity, axis=-1)
+    return (peak - equity).max(axis=-1)
+
+
+def estimate_periods_per_year(history: list) -> float:
+    """
+    Number of snapshot intervals per year from the recorded timestamps,
+    None if the history has no timestamps
+    """
+    timestamps = np.array(
+        [state.get("timestamp") or np.nan for state in history], dtype=float
+    )
+    intervals = np.diff(timestamps)
+    intervals = intervals[np.isfinite(intervals) & (intervals > 0)]
+    if not len(intervals):
+        return None
+    return SECONDS_PER_YEAR / np.median(intervals)
+
+
+def _score(pnl: np.array, objective: str) -> float:
+    if objective == "pnl":
+        return float(pnl.sum())
+    elif objective == "sharpe":
+        sharpe = float(sharpe_ratio(pnl))
+        return -np.inf if np.isnan(sharpe) else sharpe
+    raise ValueError(f"Unknown objective: {objective}")
+
+
+def evaluate_window(
+    strategy_cls,
+    candidates: list,
+    train: list,
+    test: list,
+    warmup_size: int,
+    objective: str = "sharpe",
+) -> dict:
+    """
+    Pick the best candidate parameters on the train snapshots and trade
+    them on the test snapshots, warmed up with the end of the train window
+    """
+    train_scores = [
+        _score(run_backtest(strategy_cls, params, train), objective)
+        for params in candidates
+    ]
+    best = int(np.argmax(train_scores))
+    warmup = train[-warmup_size:] if warmup_size else None
+    test_pnl = run_backtest(strategy_cls, candidates[best], test, warmup=warmup)
+    return dict(
+        params=candidates[best],
+        train_score=train_scores[best],
+        test_pnl=test_pnl,
+    )
+
+
+def block_bootstrap(
+    pnl: np.array, block_size: int, n_resamples: int, seed: int = None
+) -> np.array:
+    """
+    Resamples (n_resamples, len(pnl)) of the pnl series built from randomly
+    chosen contiguous blocks, which keeps the autocorrelation within blocks
+    """
+    n = len(pnl)
+    block_size = max(1, min(block_size, n))
+    n_blocks = math.ceil(n / block_size)
+    rng = np.random.default_rng(seed)
+    starts = rng.integers(0, n - block_size + 1, size=(n_resamples, n_blocks))
+    idx = (starts[:, :, None] + np.arange(block_size)).reshape(n_resamples, -1)
+    return pnl[idx[:, :n]]
+
+
+def bootstrap_statistics(
+    pnl: np.array,
+    block_size: int,
+    n_resamples: int,
+    seed: int = None,
+    periods_per_year: float = None,
+) -> np.array:
+    """
+    Total pnl, Sharpe ratio and max drawdown of every resample as
+    array of shape (3, n_resamples)
+    """
+    samples = block_bootstrap(pnl, block_size, n_resamples, seed=seed)
+    return np.stack(
+        [
+            samples.sum(axis=1),
+            sharpe_ratio(samples, periods_per_year),
+            max_drawdown(samples),
+        ]
+    )
+
+
+def _map(fn, args: list, n_workers: int) -> list:
+    """
+    Call fn(*a) for all a in args, in a process pool if n_workers > 1
+    """
+    if n_workers is None or n_workers <= 1:
+        return [fn(*a) for a in args]
+    with ProcessPoolExecutor(max_workers=n_workers) as pool:
+        futures = [pool.submit(fn, *a) for a in args]
+        return [future.result() for future in futures]
+
+
+def evaluate(
+    history: list,
+    strategy_cls,
+    param_grid: dict,
+    train_size: int,
+    test_size: int,
+    step: int = None,
+    warmup_size: int = 100,
+    objective: str = "sharpe",
+    n_resamples: int = 1000,
+    block_size: int = 50,
+    batch_size: int = 250,
+    n_workers: int = None,
+    seed: int = 0,
+) -> dict:
+    """
+    Walk-forward evaluation of strategy_cls over the recorded snapshots.
+    Every window selects the parameters from param_grid with the best
+    objective ("sharpe" or "pnl") on its train part. The concatenated
+    out-of-sample pnl is block-bootstrapped in batches of batch_size
+    resamples. Returns a report dict, see format_report
+    """
+    windows = walk_forward_windows(len(history), train_size, test_size, step)
+    if not windows:
+        raise ValueError(
+            f"History of {len(history)} snapshots is too short for "
+            f"train_size={train_size} and test_size={test_size}"
+        )
+    candidates = param_combinations(param_grid)
+    results = _map(
+        evaluate_window,
+        [
+            (
+                strategy_cls,
+                candidates,
+                history[start:train_end],
+                history[train_end:test_end],
+                warmup_size,
+                objective,
+            )
+            for start, train_end, test_end in windows
+        ],
+        n_workers,
+    )
+
+    periods_per_year = estimate_periods_per_year(history)
+    oos_pnl = np.concatenate([result["test_pnl"] for result in results])
+    batches = [
+        (
+            oos_pnl,
+            block_size,
+            min(batch_size, n_resamples - i),
+            seed + i,
+            periods_per_year,
+        )
+        for i in range(0, n_resamples, batch_size)
+    ]
+    statistics = np.concatenate(_map(bootstrap_statistics, batches, n_workers), axis=1)
+    total_pnl, sharpe, drawdown = statistics
+
+    return dict(
+        strategy=strategy_cls.__name__,
+        windows=[
+            dict(
+                train=(start, train_end),
+                test=(train_end, test_end),
+                params=result["params"],
+                train_score=result["train_score"],
+                test_pnl=float(result["test_pnl"].sum()),
+                test_sharpe=float(sharpe_ratio(result["test_pnl"], periods_per_year)),
+            )
+            for (start, train_end, test_end), result in zip(windows, results)
+        ],
+        oos_pnl=float(oos_pnl.sum()),
+        oos_sharpe=float(sharpe_ratio(oos_pnl, periods_per_year)),
+        oos_max_drawdown=float(max_drawdown(oos_pnl)),
+        bootstrap=dict(
+            n_resamples=n_resamples,
+            block_size=block_size,
+            pnl=dict(
+                zip(
+                    BOOTSTRAP_PERCENTILES,
+                    np.percentile(total_pnl, BOOTSTRAP_PERCENTILES),
+                )
+            ),
+            sharpe=dict(
+                zip(
+                    BOOTSTRAP_PERCENTILES,
+                    np.nanpercentile(sharpe, BOOTSTRAP_PERCENTILES),
+                )
+            ),
+            max_drawdown=dict(
+                zip(
+                    BOOTSTRAP_PERCENTILES,
+                    np.percentile(drawdown, BOOTSTRAP_PERCENTILES),
+                )
+            ),
+            prob_loss=float(np.mean(total_pnl < 0)),
+        ),
+    )
+
+
+def evaluate_history_file(path: str, strategy_cls, param_grid: dict, **kwargs) -> dict:
+    """
+    evaluate on a history file written by persistence.record_market_state
+    """
+    history = persistence.load_history(path)
+    return evaluate(history, strategy_cls, param_grid, **kwargs)
+
+
+def format_report(report: dict) -> str:
+    """
+    Plain text summary of an evaluate report
+    """
+    lines = [f"{report['strategy']}: {len(report['windows'])} walk-forward windows"]
+    for window in report["windows"]:
+        lines.append(
+            f"  test {window['test'][0]:>7}-{window['test'][1]:<7} "
+            f"pnl {window['test_pnl']:>10.4f}  sharpe {window['test_sharpe']:>7.2f}  "
+            f"params {window['params']}"
+        )
+    lines.append(
+        f"out of sample: pnl {report['oos_pnl']:.4f}, "
+        f"sharpe {report['oos_sharpe']:.2f}, "
+        f"max drawdown {report['oos_max_drawdown']:.4f}"
+    )
+    bootstrap = report["bootstrap"]
+    lines.append(
+        f"bootstrap ({bootstrap['n_resamples']} resamples, "
+        f"blocks of {bootstrap['block_size']}): "
+        f"P(loss) {bootstrap['prob_loss']:.1%}"
+    )
+    for name in ("pnl", "sharpe", "max_drawdown"):
+        percentiles = ", ".join(
+            f"p{p} {value:.4f}" for p, value in bootstrap[name].items()
+        )
+        lines.append(f"  {name:<12}: {percentiles}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    from strategies import SobiStrategy
+
+    logging.basicConfig(level=logging.WARNING)
+    logger.setLevel(logging.INFO)
+
+    # user inputs
+    HISTORY_PATHS = {"XETHZUSD": "history_XETHZUSD.pkl"}
+    PARAM_GRID = dict(
+        window_size=[5, 10, 20],
+        theta=[0.05, 0.1, 0.2],
+        depth=[10, 30, 50],
+        position_size=[0.1],
+        sleep_seconds=[0],
+    )
+
+    for pair, path in HISTORY_PATHS.items():
+        report = evaluate_history_file(
+            path,
+            SobiStrategy,
+            PARAM_GRID,
+            train_size=2000,
+            test_size=500,
+            n_workers=8,
+        )
+        logger.info(f"{pair}\n{format_report(report)}\n")
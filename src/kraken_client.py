@@ -1,16 +1,80 @@
 """
 Interface for the Kraken API
 """
+import time
 import logging
 import requests
 import numpy as np
-from tenacity import retry, wait_fixed, stop_after_attempt
+
+import metrics
+import profiling
+from backoff import (
+    CircuitOpenError,
+    DeadlineExceeded,
+    RetryLaterError,
+    RetryPolicy,
+    TransientError,
+)
+from response_cache import ResponseCache
 
 #### setup
 logger = logging.getLogger(__name__)
+REQUESTS = metrics.REGISTRY.counter(
+    "arthur_requests_total", "Requests sent to the public kraken api"
+)
+REQUEST_FAILURES = metrics.REGISTRY.counter(
+    "arthur_request_failures_total", "Failed requests to the public kraken api"
+)
+REQUEST_LATENCY = metrics.REGISTRY.histogram(
+    "arthur_request_seconds", "Round trip time of requests to the public kraken api"
+)
 
 #### constants
 URL_PUBLIC = "https://api.kraken.com/0/public"
+ORDERBOOK_DTYPE = [("price", float), ("volume", float), ("timestamp", int)]
+OHLC_DTYPE = [
+    ("timestamp", int),
+    ("open", float),
+    ("high", float),
+    ("low", float),
+    ("close", float),
+    ("vwap", float),
+    ("volume", float),
+    ("count", int),
+]
+REQUEST_TIMEOUT = 10  # seconds, connect and read
+# kraken errors worth a retry, all others are returned to the caller
+TRANSIENT_ERRORS = (
+    "EService:Unavailable",
+    "EService:Busy",
+    "EAPI:Rate limit exceeded",
+    "EGeneral:Temporary lockout",
+)
+TICKER_DTYPE = [("pair", "U16"), ("bid", float), ("ask", float), ("last", float)]
+
+# compact trade record: side/order type as int8 codes, misc flags as bitfield
+TRADES_DTYPE = [
+    ("price", np.float64),
+    ("volume", np.float64),
+    ("timestamp", np.float64),
+    ("direction", np.int8),  # 1: buy, -1: sell, 0: unknown
+    ("type", np.int8),  # 0: market, 1: limit, -1: unknown
+    ("misc", np.uint32),  # bit i set: flag letter chr(ord("a") + i) present
+    ("trade_id", np.int64),  # 0 if not sent by the api
+]
+DIRECTION_CODES = {"b": 1, "s": -1}
+TYPE_CODES = {"m": 0, "l": 1}
+# codes of letters the api is not known to send
+UNKNOWN_DIRECTION = 0
+UNKNOWN_TYPE = -1
+
+# shared by all callers in this process, configure TTLs via set_ttl
+RESPONSE_CACHE = ResponseCache()
+# non-blocking: a failing pair is skipped until its backoff delay passed,
+# sequential loops over many pairs don't wait for it
+RETRY_POLICY = RetryPolicy(
+    retry_on=(requests.RequestException, TransientError), blocking=False
+)
 
 #### functions
 def get_server_time() -> tuple:
@@ -19,7 +83,7 @@ def get_server_time() -> tuple:
     """
     response = send_public_request(endpoint="Time")
     if response.get("error"):
-        logging.info(f"Server Time Request Failed: {response.status_code}")
+        logging.info(f'Server Time Request Failed: {response["error"]}')
         return None, None
     else:
         server_time_rfc, server_time_unix = (
@@ -30,28 +94,49 @@ def get_server_time() -> tuple:
         return server_time_rfc, server_time_unix
 
 
-def get_orderbook(pair: str) -> tuple:
+def last_response_age() -> float:
+    """
+    Age in seconds of the response behind the last getter call of this
+    thread, > 0 if it was served from the response cache
+    """
+    return RESPONSE_CACHE.last_age()
+
+
+def get_orderbook(
+    pair: str, count: int = None, out: tuple = None, deadline: float = None
+) -> tuple:
     """
     Load current order book for asset pair
+    count: maximum number of levels per side (kraken default: 100)
+    out: optional tuple of preallocated (bid_columns, ask_columns), see
+        parse_orderbook_into_columns. bids and asks are then returned as
+        views into these buffers instead of newly allocated arrays
+    deadline: see send_public_request
     """
-    response = send_public_request(endpoint="Depth", payload={"pair": pair})
+    payload = {"pair": pair}
+    if count is not None:
+        payload["count"] = count
+    response = send_public_request(endpoint="Depth", payload=payload, deadline=deadline)
     if response.get("error"):
         logging.info(f'Error while loading orderbook data: {response["error"]}')
         return None, None, None
     else:
         orderbook = response["result"].get(pair)
-        bids, asks = parse_orderbook_into_arr(orderbook)
+        if out is None:
+            bids, asks = parse_orderbook_into_arr(orderbook)
+        else:
+            bids, asks = parse_orderbook_into_columns(orderbook, *out)
         return orderbook, bids, asks
 
 
-def get_ohlc(pair: str, interval: int = 1) -> np.array:
+def get_ohlc(pair: str, interval: int = 1, deadline: float = None) -> np.array:
     """
     Get OpenHighLowClose data from kraken for specific pair
     Always returns the latest 720 periods
     Interval: period size in minutes
     """
     response = send_public_request(
-        endpoint="OHLC", payload={"pair": pair, "interval": interval}
+        endpoint="OHLC", payload={"pair": pair, "interval": interval}, deadline=deadline
     )
     if response.get("error"):
         logging.info(f'Error while loading ohlc data: {response["error"]}')
@@ -62,32 +147,126 @@ def get_ohlc(pair: str, interval: int = 1) -> np.array:
         return ohlc_arr
 
 
-def get_lasttrades(pair: str) -> np.array:
+def get_ticker(pairs: list, deadline: float = None) -> np.array:
+    """
+    Get best bid, best ask and last trade price for several pairs
+    with a single request. Rows are in the order of pairs
+    """
+    response = send_public_request(
+        endpoint="Ticker", payload={"pair": ",".join(pairs)}, deadline=deadline
+    )
+    if response.get("error"):
+        logging.info(f'Error while loading ticker data: {response["error"]}')
+        return None
+    else:
+        ticker_arr = parse_ticker_into_arr(response["result"], pairs)
+        return ticker_arr
+
+
+def get_lasttrades(pair: str, since: str = None, deadline: float = None) -> tuple:
     """
     Get last trades from kraken for specific pair
+    since: cursor returned by the previous call, only newer trades are
+        returned. Returns the trades (TRADES_DTYPE) and the next cursor
     """
-    response = send_public_request(endpoint="Trades", payload={"pair": pair})
+    payload = {"pair": pair}
+    if since is not None:
+        payload["since"] = since
+    response = send_public_request(endpoint="Trades", payload=payload, deadline=deadline)
     if response.get("error"):
         logging.info(f'Error while loading lasttrades: {response["error"]}')
-        return None
+        return None, since
     else:
         lasttrades_list = response["result"].get(pair)
         lasttrades_arr = parse_lasttrades_into_arr(lasttrades_list)
-        return lasttrades_arr
+        return lasttrades_arr, response["result"].get("last", since)
+
+
+@profiling.timed
+def send_public_request(
+    endpoint: str, payload: dict = None, deadline: float = None
+) -> dict:
+    """
+    Send request to the public kraken endpoint or serve it from the
+    response cache. kwargs need to be valid query parameters
+    deadline: time.monotonic after which no request is sent or retried
+    """
+    return RESPONSE_CACHE.get_or_fetch(
+        endpoint,
+        payload,
+        lambda: _send_with_retries(
+            endpoint=endpoint, payload=payload, deadline=deadline
+        ),
+    )
 
 
-@retry(wait=wait_fixed(2), stop=stop_after_attempt(5))
-def send_public_request(endpoint: str, payload: dict = None) -> dict:
+def _send_with_retries(
+    endpoint: str, payload: dict = None, deadline: float = None
+) -> dict:
+    """
+    Send the request unless RETRY_POLICY backs off for the endpoint and
+    pair. On failures, while backing off, with the endpoint down or the
+    deadline reached, an error response is returned, so that callers
+    continue with their previous data instead of stalling
+    """
+    try:
+        return RETRY_POLICY.call(
+            endpoint,
+            lambda timeout: _send_public_request(
+                endpoint=endpoint, payload=payload, timeout=timeout
+            ),
+            deadline=deadline,
+            pair=(payload or {}).get("pair"),
+        )
+    except TransientError as e:
+        return e.response
+    except (
+        CircuitOpenError,
+        DeadlineExceeded,
+        RetryLaterError,
+        requests.RequestException,
+    ) as e:
+        return {"error": [repr(e)]}
+
+
+def _send_public_request(
+    endpoint: str, payload: dict = None, timeout: float = REQUEST_TIMEOUT
+) -> dict:
     """
     Send request to the public kraken endpoint
-    kwargs need to be valid query parameters
+    kwargs need to be valid query parameters.
+    timeout is capped at REQUEST_TIMEOUT.
+    Raises TransientError for failures that are worth a retry
     """
     # send get request and check for errors
-    r = requests.get(f"{URL_PUBLIC}/{endpoint}", params=payload)
+    REQUESTS.inc(endpoint=endpoint)
+    start = time.perf_counter()
+    try:
+        r = requests.get(
+            f"{URL_PUBLIC}/{endpoint}",
+            params=payload,
+            timeout=min(timeout, REQUEST_TIMEOUT),
+        )
+    except requests.RequestException:
+        REQUEST_FAILURES.inc(endpoint=endpoint)
+        raise
+    finally:
+        REQUEST_LATENCY.observe(time.perf_counter() - start, endpoint=endpoint)
+
     if r.status_code == 200:
-        return r.json()
+        response = r.json()
+        errors = response.get("error")
+        if errors:
+            # kraken reports most api failures with status 200
+            REQUEST_FAILURES.inc(endpoint=endpoint)
+        if any(error in TRANSIENT_ERRORS for error in errors or ()):
+            raise TransientError(response)
+        return response
     else:
+        REQUEST_FAILURES.inc(endpoint=endpoint)
         logger.warning(f"Request failed with status code: {r.status_code}")
+        if r.status_code == 429 or r.status_code >= 500:
+            raise TransientError({"error": r.status_code})
         return {"error": r.status_code}
 
 
@@ -96,55 +275,142 @@ def parse_orderbook_into_arr(orderbook: list) -> tuple:
     Parse orderbook data from kraken API into np.array for bid and 
     ask side and make sure that the orders are sorted
     """
-    ask_arr = np.array(
-        [tuple(x) for x in orderbook["asks"]],
-        dtype=[("price", float), ("volume", float), ("timestamp", int)],
-    )
-    bid_arr = np.array(
-        [tuple(x) for x in orderbook["bids"]],
-        dtype=[("price", float), ("volume", float), ("timestamp", int)],
-    )
+    ask_arr = np.array([tuple(x) for x in orderbook["asks"]], dtype=ORDERBOOK_DTYPE)
+    bid_arr = np.array([tuple(x) for x in orderbook["bids"]], dtype=ORDERBOOK_DTYPE)
     bid_arr = bid_arr[bid_arr["price"].argsort()[::-1]]
     ask_arr = ask_arr[ask_arr["price"].argsort()]
 
     return bid_arr, ask_arr
 
 
+def parse_orderbook_into_columns(
+    orderbook: dict, bid_columns: dict, ask_columns: dict
+) -> tuple:
+    """
+    Parse orderbook data from kraken API into preallocated column buffers
+    (dicts with float64 price/volume and int64 timestamp arrays of
+    equal length). The buffers are overwritten in place, levels beyond
+    their capacity are dropped. Returns dicts of views on the filled part
+    """
+    n_bids = _fill_orderbook_side(orderbook["bids"], bid_columns, descending=True)
+    n_asks = _fill_orderbook_side(orderbook["asks"], ask_columns, descending=False)
+    bids = {name: col[:n_bids] for name, col in bid_columns.items()}
+    asks = {name: col[:n_asks] for name, col in ask_columns.items()}
+    return bids, asks
+
+
+def _fill_orderbook_side(levels: list, columns: dict, descending: bool) -> int:
+    """
+    Write the best price levels into the column buffers of one side, sorted
+    best first. Levels are parsed straight into the buffers. Kraken sends
+    sorted books, so they are only sorted (in place) if they arrive out of
+    order. If there are more levels than the buffer capacity, the best ones
+    are selected before truncating, so better levels are never dropped
+    """
+    price, volume, timestamp = columns["price"], columns["volume"], columns["timestamp"]
+    if len(levels) > len(price):
+        # rare: more levels than requested via count
+        prices = np.array([level[0] for level in levels], dtype=float)
+        order = np.argsort(-prices if descending else prices, kind="stable")
+        levels = [levels[i] for i in order[: len(price)]]
+
+    n = len(levels)
+    is_sorted = True
+    for i, level in enumerate(levels):
+        price[i] = level[0]
+        volume[i] = level[1]
+        timestamp[i] = level[2]
+        if i and (price[i] > price[i - 1] if descending else price[i] < price[i - 1]):
+            is_sorted = False
+    if not is_sorted:
+        filled = price[:n]
+        order = np.argsort(-filled if descending else filled, kind="stable")
+        for column in (price, volume, timestamp):
+            column[:n] = column[:n][order]
+    return n
+
+
+def parse_ticker_into_arr(ticker: dict, pairs: list) -> np.array:
+    """
+    Parse ticker data from Kraken API into np.array with one row per pair.
+    Pairs missing in the response get nan prices, they must not be used
+    as quotes
+    """
+    ticker_arr = np.full(len(pairs), np.nan, dtype=TICKER_DTYPE)
+    ticker_arr["pair"] = pairs
+    for i, pair in enumerate(pairs):
+        info = ticker.get(pair)
+        if info is None:
+            logger.warning(f"No ticker data for {pair}")
+            continue
+        ticker_arr["bid"][i] = info["b"][0]
+        ticker_arr["ask"][i] = info["a"][0]
+        ticker_arr["last"][i] = info["c"][0]
+    return ticker_arr
+
+
 def parse_ohlc_into_arr(ohlc: list) -> np.array:
     """
     Parse OHLC data from Kraken API into np.array
     From list of lists --> array
     """
-    ohlc_arr = np.array(
-        [tuple(x) for x in ohlc],
-        dtype=[
-            ("timestamp", int),
-            ("open", float),
-            ("high", float),
-            ("low", float),
-            ("close", float),
-            ("vwap", float),
-            ("volume", float),
-            ("count", int),
-        ],
-    )
+    ohlc_arr = np.array([tuple(x) for x in ohlc], dtype=OHLC_DTYPE)
     return ohlc_arr
 
 
 def parse_lasttrades_into_arr(lasttrades: list) -> np.array:
     """
-    Parse last trade data from Kraken API into np.array
-    From list of lists --> array
+    Parse last trade data from Kraken API into np.array (TRADES_DTYPE)
+    From list of lists [price, volume, time, buy/sell, market/limit, misc,
+    (trade_id)] --> array
     """
-    lasttrades_arr = np.array(
-        [tuple(x) for x in lasttrades],
-        dtype=[
-            ("price", float),
-            ("volume", float),
-            ("timestamp", int),
-            ("direction", object),
-            ("type", object),
-            ("misc", object),
-        ],
+    lasttrades_arr = np.zeros(len(lasttrades), dtype=TRADES_DTYPE)
+    if not lasttrades:
+        return lasttrades_arr
+    columns = list(zip(*lasttrades))
+    lasttrades_arr["price"] = np.array(columns[0], dtype=float)
+    lasttrades_arr["volume"] = np.array(columns[1], dtype=float)
+    lasttrades_arr["timestamp"] = np.array(columns[2], dtype=float)
+    lasttrades_arr["direction"] = _encode(
+        columns[3], DIRECTION_CODES, UNKNOWN_DIRECTION
     )
+    lasttrades_arr["type"] = _encode(columns[4], TYPE_CODES, UNKNOWN_TYPE)
+    # few distinct misc strings --> encode each of them once
+    misc, inverse = np.unique(np.array(columns[5], dtype=str), return_inverse=True)
+    lasttrades_arr["misc"] = np.array([encode_misc(m) for m in misc])[inverse]
+    lasttrades_arr["trade_id"] = [row[6] if len(row) > 6 else 0 for row in lasttrades]
     return lasttrades_arr
+
+
+def _encode(values: tuple, codes: dict, unknown: int) -> np.array:
+    """
+    Map single letter codes of the api to the int8 codes of TRADES_DTYPE,
+    letters missing in codes are mapped to unknown
+    """
+    values = np.array(values, dtype=str)
+    encoded = np.full(len(values), unknown, dtype=np.int8)
+    for letter, code in codes.items():
+        encoded[values == letter] = code
+    n_unknown = int(np.count_nonzero(~np.isin(values, list(codes))))
+    if n_unknown:
+        unknown_letters = set(values) - set(codes)
+        logger.warning(f"{n_unknown} trades with unknown codes {unknown_letters}")
+    return encoded
+
+
+def encode_misc(misc: str) -> int:
+    """
+    Bitfield of the single letter flags in the misc field of a trade
+    """
+    bits = 0
+    for letter in misc:
+        if "a" <= letter <= "z":
+            bits |= 1 << (ord(letter) - ord("a"))
+    return bits
+
+
+def decode_misc(bits: int) -> str:
+    """
+    Inverse of encode_misc
+    """
+    return "".join(chr(ord("a") + i) for i in range(26) if bits >> i & 1)
@@ -0,0 +1,189 @@
+"""
+Load test of the trading pipeline against the local Kraken stand-in
+--> measures end-to-end iterations per second for many pairs and strategies
+--> every iteration runs main.run_iteration, the production loop body with
+    stale data handling, scheduler, logging and metrics
+"""
+import time
+import logging
+import threading
+
+import numpy as np
+
+import kraken_client
+from backtest import Backtest
+from clock import ServerClock
+from data_center import DataCenter
+from main import run_iteration
+from scheduler import Scheduler
+from simulator import KrakenStandIn, SyntheticMarket
+from strategies import SobiStrategy, TrendStrategy
+
+#### setup
+logger = logging.getLogger(__name__)
+
+
+def make_strategy(kind: str):
+    """
+    Strategy with the parameters used in main.py
+    """
+    if kind == "sobi":
+        return SobiStrategy(
+            window_size=10, theta=0.1, depth=30, position_size=0.1, sleep_seconds=0
+        )
+    elif kind == "trend":
+        return TrendStrategy(
+            window_size=10, adx_threshold=20, position_size=0.1, sleep_seconds=0
+        )
+    raise ValueError(f"Unknown strategy: {kind}")
+
+
+def run_load_test(
+    n_pairs: int = 10,
+    strategies: tuple = ("sobi", "trend"),
+    duration_seconds: float = 10,
+    n_workers: int = 4,
+    error_rate: float = 0.0,
+    rate_limit: tuple = None,
+    latency: float = 0.0,
+    use_cache: bool = True,
+    max_staleness: float = 5,
+) -> dict:
+    """
+    Run every strategy on every synthetic pair as fast as possible for
+    duration_seconds. Pairs are spread over n_workers threads, data older
+    than max_staleness seconds is treated as stale.
+    Returns iterations per second, failed iterations and latency percentiles
+    """
+    pairs = [f"SYN{i}USD" for i in range(n_pairs)]
+    markets = {
+        pair: SyntheticMarket(start_price=100 * (i + 1), seed=i)
+        for i, pair in enumerate(pairs)
+    }
+    jobs = [(pair, kind) for pair in pairs for kind in strategies]
+
+    url_public, ttls = kraken_client.URL_PUBLIC, kraken_client.RESPONSE_CACHE.ttls
+    stand_in = KrakenStandIn(
+        markets, error_rate=error_rate, rate_limit=rate_limit, latency=latency
+    )
+    with stand_in:
+        kraken_client.URL_PUBLIC = stand_in.url
+        kraken_client.RESPONSE_CACHE.clear()
+        if not use_cache:
+            kraken_client.RESPONSE_CACHE.ttls = {}
+        try:
+            results, elapsed = _run_workers(
+                jobs, duration_seconds, n_workers, max_staleness
+            )
+        finally:
+            kraken_client.URL_PUBLIC = url_public
+            kraken_client.RESPONSE_CACHE.ttls = ttls
+        n_requests = stand_in.request_count
+
+    latencies = np.concatenate([r["latencies"] for r in results] + [np.empty(0)])
+    n_iterations = len(latencies)
+    n_failed = sum(r["failed"] for r in results)
+    report = dict(
+        pairs=n_pairs,
+        strategies=len(strategies),
+        workers=n_workers,
+        iterations=n_iterations,
+        failed=n_failed,
+        iterations_per_second=n_iterations / elapsed,
+        requests_per_second=n_requests / elapsed,
+    )
+    if n_iterations:
+        p50, p90, p99 = np.percentile(latencies, (50, 90, 99))
+        report.update(
+            latency_p50=float(p50), latency_p90=float(p90), latency_p99=float(p99)
+        )
+    return report
+
+
+def _run_workers(
+    jobs: list, duration_seconds: float, n_workers: int, max_staleness: float
+) -> tuple:
+    """
+    Spread the (pair, strategy) jobs round robin over worker threads.
+    Returns the results of the workers and the elapsed seconds
+    """
+    clock = ServerClock()
+    clock.sync()
+    start = time.perf_counter()
+    deadline = time.monotonic() + duration_seconds
+    results = [dict(latencies=[], failed=0) for _ in range(n_workers)]
+    threads = [
+        threading.Thread(
+            target=_worker,
+            args=(jobs[i::n_workers], clock, deadline, max_staleness, results[i]),
+            daemon=True,
+        )
+        for i in range(n_workers)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.perf_counter() - start
+
+
+def _worker(
+    jobs: list, clock: ServerClock, deadline: float, max_staleness: float, result: dict
+) -> None:
+    """
+    Run main.run_iteration for the given jobs until the deadline, without
+    pacing (scheduler interval 0)
+    """
+    contexts = [
+        (
+            pair,
+            make_strategy(kind),
+            Backtest(max_orders=100),
+            DataCenter(pair, clock=clock, max_staleness=max_staleness),
+            Scheduler(interval_seconds=0),
+        )
+        for pair, kind in jobs
+    ]
+    while contexts and time.monotonic() < deadline:
+        for pair, strategy, engine, data_center, scheduler in contexts:
+            start = time.perf_counter()
+            try:
+                run_iteration(
+                    pair=pair,
+                    strategy=strategy,
+                    engine=engine,
+                    data_center=data_center,
+                    scheduler=scheduler,
+                )
+            except Exception as e:
+                # errors injected by the stand-in surface as missing data
+                logger.debug(f"Iteration failed: {e!r}")
+                result["failed"] += 1
+                continue
+            result["latencies"].append(time.perf_counter() - start)
+    return None
+
+
+if __name__ == "__main__":
+    # quiet per-iteration logs of main, keep the report of this module
+    logging.getLogger().setLevel(logging.WARNING)
+    logger.setLevel(logging.INFO)
+
+    # user inputs
+    N_PAIRS = 30
+    STRATEGIES = ("sobi", "trend")
+    DURATION_SECONDS = 20
+    N_WORKERS = 8
+    ERROR_RATE = 0.01  # share of requests answered with an error
+    RATE_LIMIT = None  # e.g. (15, 20): requests per second, burst
+
+    report = run_load_test(
+        n_pairs=N_PAIRS,
+        strategies=STRATEGIES,
+        duration_seconds=DURATION_SECONDS,
+        n_workers=N_WORKERS,
+        error_rate=ERROR_RATE,
+        rate_limit=RATE_LIMIT,
+    )
+    for key, value in report.items():
+        logger.info(f"{key:<24}: {value}")
@@ -7,10 +7,14 @@ import time
 import logging
 import numpy as np
 
-from data_center import DataCenter
+from data_center import DataCenter, MultiPairDataCenter
 from strategies import Strategy
 import kraken_client
+import metrics
+import persistence
+import profiling
 import utils as ut
+from scheduler import Scheduler
 
 from strategies import SobiStrategy, TrendStrategy
 from backtest import Backtest
@@ -23,23 +27,103 @@ logging.basicConfig(
     datefmt="%m-%d %H:%M:%S",
 )
 
+# metrics setup
+ITERATION_LATENCY = metrics.REGISTRY.histogram(
+    "arthur_iteration_seconds", "Duration of one iteration without the sleep"
+)
+POSITION = metrics.REGISTRY.gauge("arthur_position", "Current position")
+PNL = metrics.REGISTRY.gauge("arthur_pnl", "Current profit and loss")
+TURNOVER = metrics.REGISTRY.gauge("arthur_turnover", "Total traded volume")
+MAX_DRAWDOWN = metrics.REGISTRY.gauge("arthur_max_drawdown", "Maximum pnl drawdown")
+SHARPE = metrics.REGISTRY.gauge("arthur_sharpe", "Annualized Sharpe ratio of pnl")
+
 
 def run_iteration(
-    pair: str, strategy: Strategy, engine: Backtest, data_center: DataCenter
+    pair: str,
+    strategy: Strategy,
+    engine: Backtest,
+    data_center: DataCenter,
+    history_path: str = None,
+    scheduler: Scheduler = None,
 ):
     """
     Run one round trip
     --> Gather and updat data
     --> Recalculate strategy indicators and signals
     --> rebalance position if necessary
+    With a scheduler, data that didn't arrive before the end of the current
+    slot is skipped and the loop waits for the next slot instead of sleeping
     """
 
+    start = time.perf_counter()
+
     # query latest data from exchange
-    market_state = data_center.get_market_data()
+    deadline = None if scheduler is None else scheduler.deadline
+    market_state = data_center.get_market_data(deadline=deadline)
+    if history_path is not None:
+        persistence.record_market_state(history_path, market_state)
+
+    trade_on_market_state(
+        pair=pair, strategy=strategy, engine=engine, market_state=market_state
+    )
+    ITERATION_LATENCY.observe(time.perf_counter() - start, pair=pair)
+
+    # conform to krakens call rate limit
+    if scheduler is None:
+        time.sleep(strategy.sleep_seconds)
+    else:
+        scheduler.wait()
+
+
+def run_multi_pair_iteration(
+    strategies: dict,
+    engines: dict,
+    data_center: MultiPairDataCenter,
+    scheduler: Scheduler = None,
+):
+    """
+    Run one round trip for several pairs (dicts pair -> strategy/engine)
+    with the market data of all pairs loaded at once. With a scheduler,
+    requests stop at the end of the current slot
+    """
+
+    start = time.perf_counter()
+    deadline = None if scheduler is None else scheduler.deadline
+    market_data = data_center.get_market_data(deadline=deadline)
+    for pair, strategy in strategies.items():
+        trade_on_market_state(
+            pair=pair,
+            strategy=strategy,
+            engine=engines[pair],
+            market_state=market_data[pair],
+        )
+    ITERATION_LATENCY.observe(time.perf_counter() - start, pair="all")
+
+    # conform to krakens call rate limit
+    if scheduler is None:
+        time.sleep(min(strategy.sleep_seconds for strategy in strategies.values()))
+    else:
+        scheduler.wait()
+
+
+def trade_on_market_state(
+    pair: str, strategy: Strategy, engine: Backtest, market_state: dict
+):
+    """
+    Recalculate strategy indicators and signals, rebalance the position
+    and report the result. Stale snapshots don't update the strategy and
+    the current position is held, the engine also refuses to rebalance on
+    a stale order book
+    """
 
     # update indicators and signals
-    strategy.update_market_state(current_state=market_state)
-    desired_position = strategy.desired_position
+    stale = market_state.get("stale", ())
+    if stale:
+        logging.warning(f"{pair}: stale market data {stale}, holding position")
+        desired_position = engine.current_position
+    else:
+        strategy.update_market_state(current_state=market_state)
+        desired_position = strategy.desired_position
 
     # create orders and calculate pnl
     engine.update_market_state(market_state)
@@ -48,11 +132,13 @@ def run_iteration(
     last_order = engine.get_last_order()
 
     # log output to console
+    order_book = market_state.get("order_book")
     log_info = dict(
+        pair=pair,
         time_rfc=market_state["time"],
-        midprice=market_state["order_book"].midprice,
-        best_bid=market_state["order_book"].best_bid,
-        best_ask=market_state["order_book"].best_ask,
+        midprice=None if order_book is None else order_book.midprice,
+        best_bid=None if order_book is None else order_book.best_bid,
+        best_ask=None if order_book is None else order_book.best_ask,
         **strategy.indicators,
         current_signal=strategy.trade_signal,
         last_order=last_order,
@@ -61,24 +147,106 @@ def run_iteration(
     log_msg = ut.get_log_msg(log_info)
     logging.info(log_msg)
 
-    # conform to krakens call rate limit
-    time.sleep(strategy.sleep_seconds)
+    # update metrics
+    POSITION.set(engine.current_position, pair=pair)
+    PNL.set(pnl, pair=pair)
+    TURNOVER.set(engine.get_total_turnover(), pair=pair)
+    MAX_DRAWDOWN.set(engine.performance.max_drawdown, pair=pair)
+    SHARPE.set(engine.performance.sharpe, pair=pair)
+
+
+def main_multi_pair(strategies: dict):
+    """
+    Run one strategy per pair (dict pair -> strategy). Quotes of all pairs
+    come from one Ticker request, the full order book is only loaded for
+    strategies that require it
+    """
+
+    engines = {pair: Backtest() for pair in strategies}
+    data_center = MultiPairDataCenter.from_strategies(strategies)
+    scheduler = Scheduler(
+        interval_seconds=min(strategy.sleep_seconds for strategy in strategies.values())
+    )
+
+    while True:
+        run_multi_pair_iteration(
+            strategies=strategies,
+            engines=engines,
+            data_center=data_center,
+            scheduler=scheduler,
+        )
 
 
 def main(
-    pair: str, strategy: Strategy,
+    pair: str,
+    strategy: Strategy,
+    checkpoint_path: str = None,
+    checkpoint_seconds: float = 60,
+    history_path: str = None,
+    prefill_records: int = 1000,
+    metrics_port: int = None,
+    metrics_path: str = None,
+    max_orders: int = None,
+    order_log_path: str = None,
+    max_staleness: float = None,
 ):
     """
     Initialize context and run the given stragety
+    --> restore strategy and backtest state from checkpoint_path if possible,
+        otherwise prefill the strategy from the last prefill_records
+        snapshots of the recorded history
+    --> export metrics on http://localhost:metrics_port/metrics and/or
+        into the file metrics_path
+    --> keep only max_orders fills in memory, older ones go to order_log_path
+    --> iterations run on a fixed grid of strategy.sleep_seconds, data
+        older than max_staleness seconds is treated as stale
     """
 
-    backtester = Backtest()
-    data_center = DataCenter(pair=pair)
+    backtester = Backtest(max_orders=max_orders, order_log_path=order_log_path)
+    data_center = DataCenter(pair=pair, max_staleness=max_staleness)
 
-    while True:
-        run_iteration(
-            pair=pair, strategy=strategy, engine=backtester, data_center=data_center
+    checkpointer = None
+    restored = False
+    if checkpoint_path is not None:
+        checkpointer = persistence.Checkpointer(
+            path=checkpoint_path, interval_seconds=checkpoint_seconds
         )
+        restored = checkpointer.restore(strategy, backtester)
+    if not restored and prefill_records and history_path is not None:
+        history = persistence.load_history(history_path, max_records=prefill_records)
+        strategy.prefill(history)
+
+    # start the slot grid only now, a slow startup doesn't count as overrun
+    scheduler = Scheduler(interval_seconds=strategy.sleep_seconds)
+
+    metrics_exporter = None
+    if metrics_port is not None:
+        metrics.start_http_server(port=metrics_port)
+    if metrics_path is not None:
+        metrics_exporter = metrics.FileExporter(path=metrics_path)
+
+    # profile on demand, see profiling.LoopProfiler
+    loop_profiler = profiling.LoopProfiler()
+    loop_profiler.install_signal_handlers()
+
+    try:
+        while True:
+            with loop_profiler.iteration():
+                run_iteration(
+                    pair=pair,
+                    strategy=strategy,
+                    engine=backtester,
+                    data_center=data_center,
+                    history_path=history_path,
+                    scheduler=scheduler,
+                )
+            if checkpointer is not None:
+                checkpointer.maybe_save(strategy, backtester)
+            if metrics_exporter is not None:
+                metrics_exporter.maybe_write()
+    finally:
+        if checkpointer is not None:
+            checkpointer.save(strategy, backtester)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,464 @@
+"""
+Shared memory market data bus
+--> one fetcher process polls Kraken and publishes order book and OHLC
+    arrays of every pair into multiprocessing.shared_memory segments
+--> strategy worker processes read them zero-copy as OrderBook/PublicTrades
+    views, consistency is ensured with a sequence lock (seqlock)
+--> workers trade on copies of the strategies and engines and send their
+    results back over a queue, see collect_results
+"""
+import sys
+import time
+import queue
+import logging
+import multiprocessing as mp
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import kraken_client
+import metrics
+import utils as ut
+from clock import RFC1123_FMT, ServerClock
+from data_center import DataCenter, OrderBook, PublicTrades
+
+#### setup
+logger = logging.getLogger(__name__)
+# same metrics as the single process loop in main
+POSITION = metrics.REGISTRY.gauge("arthur_position", "Current position")
+PNL = metrics.REGISTRY.gauge("arthur_pnl", "Current profit and loss")
+TURNOVER = metrics.REGISTRY.gauge("arthur_turnover", "Total traded volume")
+MAX_DRAWDOWN = metrics.REGISTRY.gauge("arthur_max_drawdown", "Maximum pnl drawdown")
+SHARPE = metrics.REGISTRY.gauge("arthur_sharpe", "Annualized Sharpe ratio of pnl")
+
+#### constants
+N_OHLC = 720
+HEADER_DTYPE = [
+    ("seq", np.int64),  # odd while the publisher is writing
+    ("n_bids", np.int64),
+    ("n_asks", np.int64),
+    ("n_ohlc", np.int64),
+    ("timestamp", np.float64),  # snapshot time
+    ("book_timestamp", np.float64),  # when the published book was received
+    ("ohlc_timestamp", np.float64),
+    ("stale", np.int64),  # bit i set: STALE_COMPONENTS[i] is stale
+]
+STALE_COMPONENTS = ("order_book", "public_trades")
+
+
+def segment_name(prefix: str, pair: str) -> str:
+    return f"{prefix}_{pair}"
+
+
+class PairSegment:
+    """
+    Arrays of one pair in a shared memory segment:
+    header | bid columns | ask columns | ohlc rows
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, depth: int, n_ohlc: int):
+        self.shm = shm
+        self.depth = depth
+        self.n_ohlc = n_ohlc
+        offset = 0
+        self.header, offset = self._array(HEADER_DTYPE, 1, offset)
+        self.bids, offset = self._columns(depth, offset)
+        self.asks, offset = self._columns(depth, offset)
+        self.ohlc, offset = self._array(kraken_client.OHLC_DTYPE, n_ohlc, offset)
+
+    @staticmethod
+    def size(depth: int, n_ohlc: int) -> int:
+        book_side = depth * (
+            2 * np.dtype(np.float64).itemsize + np.dtype(np.int64).itemsize
+        )
+        return (
+            np.dtype(HEADER_DTYPE).itemsize
+            + 2 * book_side
+            + n_ohlc * np.dtype(kraken_client.OHLC_DTYPE).itemsize
+        )
+
+    def _array(self, dtype, n: int, offset: int) -> tuple:
+        arr = np.ndarray(n, dtype=dtype, buffer=self.shm.buf, offset=offset)
+        return arr, offset + arr.nbytes
+
+    def _columns(self, depth: int, offset: int) -> tuple:
+        columns = {}
+        for name, dtype in (
+            ("price", np.float64),
+            ("volume", np.float64),
+            ("timestamp", np.int64),
+        ):
+            columns[name], offset = self._array(dtype, depth, offset)
+        return columns, offset
+
+    @property
+    def seq(self) -> int:
+        return int(self.header["seq"][0])
+
+    def release(self) -> None:
+        """
+        Drop all views before closing, shared memory can't be closed
+        while numpy arrays still point into it
+        """
+        self.header = self.bids = self.asks = self.ohlc = None
+        try:
+            self.shm.close()
+        except BufferError:
+            # views are still referenced somewhere, the mapping is
+            # released when the process exits
+            logger.debug(f"Views into {self.shm.name} still in use")
+        return None
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """
+    Attach to an existing segment without letting the resource tracker of
+    this process unlink it at exit (only the publisher owns the segment)
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    shm = shared_memory.SharedMemory(name=name)
+    from multiprocessing import resource_tracker
+
+    resource_tracker.unregister(shm._name, "shared_memory")
+    return shm
+
+
+class MarketDataPublisher:
+    """
+    Writer side of the bus, creates and owns the segments
+    """
+
+    def __init__(
+        self,
+        pairs: list,
+        depth: int = 100,
+        n_ohlc: int = N_OHLC,
+        prefix: str = "arthur",
+    ):
+        self.segments = {}
+        for pair in pairs:
+            shm = shared_memory.SharedMemory(
+                name=segment_name(prefix, pair),
+                create=True,
+                size=PairSegment.size(depth, n_ohlc),
+            )
+            self.segments[pair] = PairSegment(shm, depth, n_ohlc)
+            self.segments[pair].header[0] = (0, 0, 0, 0, 0.0, 0.0, 0.0, 0)
+
+    def publish(self, pair: str, market_state: dict) -> None:
+        """
+        Copy order book and ohlc of a market state into the segment.
+        Components are only written (and their timestamp updated) if they
+        were received after the version already published
+        """
+        segment = self.segments[pair]
+        header = segment.header
+        order_book = market_state.get("order_book")
+        public_trades = market_state.get("public_trades")
+        timestamp = market_state.get("timestamp") or time.time()
+        received = market_state.get("received") or {}
+        book_time = received.get("order_book", timestamp)
+        ohlc_time = received.get("public_trades", timestamp)
+        stale = sum(
+            1 << i
+            for i, component in enumerate(STALE_COMPONENTS)
+            if component in market_state.get("stale", ())
+        )
+
+        header["seq"] += 1  # odd: write in progress
+        if (
+            order_book is not None
+            and order_book.bids is not None
+            and book_time is not None
+            and book_time > header["book_timestamp"][0]
+        ):
+            header["n_bids"] = _copy_side(order_book.bids, segment.bids)
+            header["n_asks"] = _copy_side(order_book.asks, segment.asks)
+            header["book_timestamp"] = book_time
+        if (
+            public_trades is not None
+            and public_trades.ohlc is not None
+            and ohlc_time is not None
+            and ohlc_time > header["ohlc_timestamp"][0]
+        ):
+            ohlc = public_trades.ohlc[-segment.n_ohlc :]
+            segment.ohlc[: len(ohlc)] = ohlc
+            header["n_ohlc"] = len(ohlc)
+            header["ohlc_timestamp"] = ohlc_time
+        header["timestamp"] = timestamp
+        header["stale"] = stale
+        header["seq"] += 1  # even: consistent
+        return None
+
+    def close(self, unlink: bool = True) -> None:
+        for segment in self.segments.values():
+            shm = segment.shm
+            segment.release()
+            if unlink:
+                shm.unlink()
+        return None
+
+
+def _copy_side(side, columns: dict) -> int:
+    n = min(len(side["price"]), len(columns["price"]))
+    for name, col in columns.items():
+        col[:n] = side[name][:n]
+    return n
+
+
+class MarketDataSubscriber:
+    """
+    Reader side of the bus. read() returns views into shared memory, so
+    a result is only valid as long as is_current(pair, seq) is True
+    """
+
+    def __init__(
+        self,
+        pairs: list,
+        depth: int = 100,
+        n_ohlc: int = N_OHLC,
+        prefix: str = "arthur",
+    ):
+        self.segments = {
+            pair: PairSegment(_attach(segment_name(prefix, pair)), depth, n_ohlc)
+            for pair in pairs
+        }
+
+    def read(self, pair: str) -> tuple:
+        """
+        Return (seq, market_state) with OrderBook/PublicTrades views,
+        waits while the publisher is writing
+        """
+        segment = self.segments[pair]
+        while True:
+            seq = segment.seq
+            if seq % 2:
+                time.sleep(0)
+                continue
+            header = segment.header[0].copy()
+            if segment.seq == seq:
+                break
+        n_bids, n_asks, n_ohlc = (
+            int(header["n_bids"]),
+            int(header["n_asks"]),
+            int(header["n_ohlc"]),
+        )
+        timestamp = float(header["timestamp"])
+
+        bids = {name: col[:n_bids] for name, col in segment.bids.items()}
+        asks = {name: col[:n_asks] for name, col in segment.asks.items()}
+        market_state = dict(
+            time=time.strftime(RFC1123_FMT, time.gmtime(timestamp)),
+            timestamp=timestamp,
+            order_book=OrderBook(bids=bids, asks=asks),
+            public_trades=PublicTrades(ohlc=segment.ohlc[:n_ohlc]),
+            received=dict(
+                order_book=float(header["book_timestamp"]) or None,
+                public_trades=float(header["ohlc_timestamp"]) or None,
+            ),
+            stale=tuple(
+                component
+                for i, component in enumerate(STALE_COMPONENTS)
+                if int(header["stale"]) >> i & 1
+            ),
+        )
+        return seq, market_state
+
+    def is_current(self, pair: str, seq: int) -> bool:
+        """
+        True if the data read with sequence number seq was not overwritten
+        """
+        return self.segments[pair].seq == seq
+
+    def wait_for_update(
+        self,
+        pair: str,
+        last_seq: int,
+        timeout: float = None,
+        poll_seconds: float = 0.01,
+    ) -> bool:
+        """
+        Block until data newer than last_seq is published. Returns False
+        if nothing was published within timeout seconds
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.segments[pair].seq <= last_seq + 1:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(poll_seconds)
+        return True
+
+    def close(self) -> None:
+        for segment in self.segments.values():
+            segment.release()
+        return None
+
+
+def run_fetcher(
+    pairs: list,
+    stop_event,
+    depth: int = 100,
+    sleep_seconds: float = 2,
+    prefix: str = "arthur",
+    ready_event=None,
+) -> None:
+    """
+    Fetcher process: poll Kraken once per pair and publish to the bus.
+    All pairs share one exchange clock
+    """
+    publisher = MarketDataPublisher(pairs, depth=depth, prefix=prefix)
+    clock = ServerClock()
+    data_centers = {
+        pair: DataCenter(pair, book_depth=depth, clock=clock) for pair in pairs
+    }
+    if ready_event is not None:
+        ready_event.set()
+    try:
+        while not stop_event.is_set():
+            for pair, data_center in data_centers.items():
+                try:
+                    publisher.publish(pair, data_center.get_market_data())
+                except Exception as e:
+                    logger.warning(f"Could not publish {pair}: {e!r}")
+            stop_event.wait(sleep_seconds)
+    finally:
+        publisher.close()
+    return None
+
+
+def run_worker(
+    pair: str,
+    strategy,
+    engine,
+    stop_event,
+    depth: int = 100,
+    prefix: str = "arthur",
+    on_result=None,
+    results=None,
+) -> None:
+    """
+    Worker process: compute signals and rebalance on every update of pair.
+    If the data is overwritten during the computation, the strategy state
+    is rolled back and the computation repeated on the newer data.
+    Every trade result (see trade_result) is logged and put into the
+    results queue if given
+    """
+    subscriber = MarketDataSubscriber([pair], depth=depth, prefix=prefix)
+    last_seq = 0
+    try:
+        while not stop_event.is_set():
+            if not subscriber.wait_for_update(pair, last_seq, timeout=1):
+                continue
+            seq, market_state = subscriber.read(pair)
+            strategy_state = strategy.get_state()
+            if market_state["stale"]:
+                # no signal on stale inputs, hold the position
+                desired_position = engine.current_position
+            else:
+                strategy.update_market_state(current_state=market_state)
+                desired_position = strategy.desired_position
+            # fill prices must come from the validated data, not from the
+            # shared memory view which the publisher may overwrite later
+            engine_state = dict(
+                market_state, order_book=market_state["order_book"].snapshot()
+            )
+            if not subscriber.is_current(pair, seq):
+                logger.debug(f"{pair}: data changed during computation, retrying")
+                strategy.set_state(strategy_state)
+                continue
+            engine.update_market_state(engine_state)
+            engine.rebalance_position(desired_position)
+            last_seq = seq
+            result = trade_result(pair, strategy, engine, engine_state)
+            logger.info(ut.get_log_msg(result))
+            if results is not None:
+                results.put(result)
+            if on_result is not None:
+                on_result(pair, strategy, engine)
+            market_state = None
+    finally:
+        market_state = None
+        subscriber.close()
+        if results is not None:
+            # don't block the exit on results nobody collects anymore
+            results.cancel_join_thread()
+    return None
+
+
+def trade_result(pair: str, strategy, engine, market_state: dict) -> dict:
+    """
+    Signals, position and pnl after a rebalance, as logged by main
+    """
+    order_book = market_state.get("order_book")
+    return dict(
+        pair=pair,
+        time_rfc=market_state["time"],
+        midprice=None if order_book is None else order_book.midprice,
+        best_bid=None if order_book is None else order_book.best_bid,
+        best_ask=None if order_book is None else order_book.best_ask,
+        **strategy.indicators,
+        current_signal=strategy.trade_signal,
+        last_order=engine.get_last_order(),
+        position=engine.current_position,
+        n_orders=engine.n_orders,
+        pnl=engine.get_current_profit(),
+        turnover=engine.get_total_turnover(),
+        max_drawdown=engine.performance.max_drawdown,
+        sharpe=engine.performance.sharpe,
+    )
+
+
+def collect_results(results, timeout: float = 0) -> list:
+    """
+    Drain the trade results sent by the workers and update the metrics
+    of this process. Waits up to timeout seconds for the first result
+    """
+    collected = []
+    try:
+        result = results.get(timeout=timeout) if timeout else results.get_nowait()
+        while True:
+            collected.append(result)
+            pair = result["pair"]
+            POSITION.set(result["position"], pair=pair)
+            PNL.set(result["pnl"], pair=pair)
+            TURNOVER.set(result["turnover"], pair=pair)
+            MAX_DRAWDOWN.set(result["max_drawdown"], pair=pair)
+            SHARPE.set(result["sharpe"], pair=pair)
+            result = results.get_nowait()
+    except queue.Empty:
+        pass
+    return collected
+
+
+def start_bus(strategies: dict, engines: dict, depth: int = 100, **fetcher_kwargs):
+    """
+    Start one fetcher and one worker process per pair (dicts
+    pair -> strategy/engine). Strategies and engines are copied into the
+    worker processes, their results arrive in the returned queue (see
+    collect_results). Returns the stop event, the processes and the queue
+    """
+    stop_event, ready_event, results = mp.Event(), mp.Event(), mp.Queue()
+    pairs = list(strategies)
+    fetcher = mp.Process(
+        target=run_fetcher,
+        args=(pairs, stop_event),
+        kwargs=dict(depth=depth, ready_event=ready_event, **fetcher_kwargs),
+        daemon=True,
+    )
+    fetcher.start()
+    ready_event.wait()
+
+    prefix = fetcher_kwargs.get("prefix", "arthur")
+    workers = [
+        mp.Process(
+            target=run_worker,
+            args=(pair, strategies[pair], engines[pair], stop_event),
+            kwargs=dict(depth=depth, prefix=prefix, results=results),
+            daemon=True,
+        )
+        for pair in pairs
+    ]
+    for worker in workers:
+        worker.start()
+    return stop_event, [fetcher] + workers, results
@@ -0,0 +1,181 @@
+"""
+Columnar container for many order book snapshots
+--> dense (n_snapshots, depth) price/volume arrays per side
+--> OBWA, mid price, spread and SOBI imbalances for all snapshots at once
+"""
+import logging
+import numpy as np
+
+#### setup
+logger = logging.getLogger(__name__)
+
+
+class OrderBookSeries:
+    """
+    N order book snapshots padded to a fixed number of levels. Padded
+    levels have price and volume 0, so they don't contribute to any
+    volume weighted average
+    """
+
+    def __init__(
+        self,
+        bid_price: np.array,
+        bid_volume: np.array,
+        ask_price: np.array,
+        ask_volume: np.array,
+        timestamps: np.array = None,
+        last_prices: np.array = None,
+    ):
+        self.bid_price = bid_price
+        self.bid_volume = bid_volume
+        self.ask_price = ask_price
+        self.ask_volume = ask_volume
+        self.timestamps = timestamps
+        self.last_prices = last_prices
+
+    @classmethod
+    def from_order_books(
+        cls,
+        order_books: list,
+        depth: int = None,
+        timestamps: np.array = None,
+        last_prices: np.array = None,
+    ) -> "OrderBookSeries":
+        """
+        Stack OrderBook objects, by default padded to the deepest book
+        """
+        if depth is None:
+            depth = max(
+                max(len(ob.bids["price"]), len(ob.asks["price"])) for ob in order_books
+            )
+        arrays = [np.zeros((len(order_books), depth)) for _ in range(4)]
+        bid_price, bid_volume, ask_price, ask_volume = arrays
+        for i, order_book in enumerate(order_books):
+            n = min(depth, len(order_book.bids["price"]))
+            bid_price[i, :n] = order_book.bids["price"][:n]
+            bid_volume[i, :n] = order_book.bids["volume"][:n]
+            n = min(depth, len(order_book.asks["price"]))
+            ask_price[i, :n] = order_book.asks["price"][:n]
+            ask_volume[i, :n] = order_book.asks["volume"][:n]
+        return cls(*arrays, timestamps=timestamps, last_prices=last_prices)
+
+    @classmethod
+    def from_history(cls, history: list, depth: int = None) -> "OrderBookSeries":
+        """
+        Build from recorded market states (see persistence.load_history),
+        last prices are taken from the public trades
+        """
+        history = [state for state in history if state.get("order_book") is not None]
+        timestamps = np.array(
+            [state.get("timestamp") or np.nan for state in history], dtype=float
+        )
+        last_prices = np.array(
+            [
+                state["public_trades"].last_price
+                if state.get("public_trades") is not None
+                else np.nan
+                for state in history
+            ],
+            dtype=float,
+        )
+        return cls.from_order_books(
+            [state["order_book"] for state in history],
+            depth=depth,
+            timestamps=timestamps,
+            last_prices=last_prices,
+        )
+
+    def __len__(self) -> int:
+        return self.bid_price.shape[0]
+
+    @property
+    def depth(self) -> int:
+        return self.bid_price.shape[1]
+
+    @property
+    def best_bid(self) -> np.array:
+        return self.bid_price[:, 0]
+
+    @property
+    def best_ask(self) -> np.array:
+        return self.ask_price[:, 0]
+
+    @property
+    def midprice(self) -> np.array:
+        return (self.best_bid + self.best_ask) / 2
+
+    @property
+    def spread(self) -> np.array:
+        return self.best_ask - self.best_bid
+
+    def obwa(self, side: str, depths) -> np.array:
+        """
+        Volume weighted average order book price for every snapshot, same
+        definition as OrderBook.obwa. depths: one depth in percent of the
+        total volume on that side (returns shape (n,)) or a sequence of
+        depths (returns shape (n, len(depths)))
+        """
+        if side not in ("bid", "ask"):
+            raise ValueError(f"Unknown side: {side}")
+        price, volume = (
+            (self.bid_price, self.bid_volume)
+            if side == "bid"
+            else (self.ask_price, self.ask_volume)
+        )
+        scalar = np.ndim(depths) == 0
+        depths = np.atleast_1d(depths).astype(float)
+
+        cum_volume = np.cumsum(volume, axis=1)
+        cum_notional = np.cumsum(price * volume, axis=1)
+        total_volume = np.sum(volume, axis=1)
+
+        # number of levels with cumulative volume <= depth% of the total,
+        # at least the best price is always used
+        thresholds = total_volume[:, None, None] * depths[None, :, None] / 100
+        n_levels = np.sum(cum_volume[:, None, :] <= thresholds, axis=2)
+        last_level = np.maximum(n_levels, 1) - 1
+
+        rows = np.arange(len(self))[:, None]
+        result = cum_notional[rows, last_level] / cum_volume[rows, last_level]
+        return result[:, 0] if scalar else result
+
+    def imbalances(self, depths, last_prices: np.array = None) -> tuple:
+        """
+        SOBI bid and ask imbalances (see SobiStrategy._calc_imbalances)
+        for every snapshot and depth
+        """
+        last_prices = self.last_prices if last_prices is None else last_prices
+        if np.ndim(depths) > 0:
+            last_prices = np.asarray(last_prices)[:, None]
+        imb_bid = last_prices - self.obwa("bid", depths)
+        imb_ask = self.obwa("ask", depths) - last_prices
+        return imb_bid, imb_ask
+
+    def features(self, depths=(10, 30, 50), last_prices: np.array = None) -> np.array:
+        """
+        Feature matrix with one row per snapshot: timestamp, last price,
+        mid price, spread and per depth d the fields vw_bid_d, vw_ask_d,
+        imb_bid_d and imb_ask_d
+        """
+        last_prices = self.last_prices if last_prices is None else last_prices
+        if last_prices is None:
+            last_prices = np.full(len(self), np.nan)
+        depths = list(depths)
+        vw_bid = self.obwa("bid", depths)
+        vw_ask = self.obwa("ask", depths)
+
+        fields = ["timestamp", "last_price", "midprice", "spread"]
+        for d in depths:
+            fields += [f"vw_bid_{d}", f"vw_ask_{d}", f"imb_bid_{d}", f"imb_ask_{d}"]
+        features = np.empty(len(self), dtype=[(name, float) for name in fields])
+
+        features["timestamp"] = np.nan if self.timestamps is None else self.timestamps
+        features["last_price"] = last_prices
+        features["midprice"] = self.midprice
+        features["spread"] = self.spread
+        for j, d in enumerate(depths):
+            features[f"vw_bid_{d}"] = vw_bid[:, j]
+            features[f"vw_ask_{d}"] = vw_ask[:, j]
+            features[f"imb_bid_{d}"] = last_prices - vw_bid[:, j]
+            features[f"imb_ask_{d}"] = vw_ask[:, j] - last_prices
+        return features
@@ -0,0 +1,195 @@
+"""
+Streaming performance analytics of the shadow trading engine
+--> every statistic is updated in O(1) per tick or fill, no history is kept
+--> drawdown, Welford mean/variance of per-interval pnl changes,
+    annualized Sharpe/Sortino, round trip wins/losses and exposure
+"""
+import math
+import logging
+
+#### setup
+logger = logging.getLogger(__name__)
+
+#### constants
+SECONDS_PER_YEAR = 365 * 24 * 3600  # crypto markets trade around the clock
+
+
+class StreamingPerformance:
+    """
+    Running risk and trade statistics. Returns are the pnl changes between
+    two ticks (the engine has no capital base), times are unix seconds or
+    tick numbers if the market states carry no timestamp
+    """
+
+    def __init__(self, periods_per_year: float = None):
+        """
+        periods_per_year: annualization factor of Sharpe/Sortino. By default
+            derived from the average tick interval in seconds, ratios are not
+            annualized if there are no timestamps
+        """
+        self.periods_per_year = periods_per_year
+        self.n_ticks = 0
+        self.last_time = None
+        self.last_equity = None
+        self.last_position = 0
+        self.uses_timestamps = False
+
+        # drawdown
+        self.peak_equity = None
+        self.drawdown = 0.0
+        self.max_drawdown = 0.0
+
+        # Welford accumulators of the per-interval returns
+        self.n_returns = 0
+        self.mean_return = 0.0
+        self._m2 = 0.0
+        self._downside_sq = 0.0
+
+        # exposure
+        self.total_time = 0.0
+        self.time_in_market = 0.0
+
+        # round trips
+        self.wins = 0
+        self.losses = 0
+        self.total_holding_time = 0.0
+        self._open_equity = None
+        self._open_time = None
+
+    def on_tick(self, equity: float, position: float, timestamp: float = None) -> None:
+        """
+        Mark to market at a new market state, position is the one held
+        since the previous tick
+        """
+        self.n_ticks += 1
+        if timestamp is None:
+            now = float(self.n_ticks)
+        else:
+            now = float(timestamp)
+            self.uses_timestamps = True
+
+        if self.last_equity is not None:
+            self._add_return(equity - self.last_equity)
+            dt = max(now - self.last_time, 0.0)
+            self.total_time += dt
+            if position != 0:
+                self.time_in_market += dt
+
+        if self.peak_equity is None or equity > self.peak_equity:
+            self.peak_equity = equity
+        self.drawdown = self.peak_equity - equity
+        self.max_drawdown = max(self.max_drawdown, self.drawdown)
+
+        self.last_time = now
+        self.last_equity = equity
+        self.last_position = position
+        return None
+
+    def on_fill(
+        self, old_position: float, new_position: float, price: float, cashflow: float
+    ) -> None:
+        """
+        Track round trips. cashflow is the cumulative cashflow before the
+        fill, so cashflow + old_position * price is the equity at which the
+        old position is closed / a new one is opened
+        """
+        flat_equity = cashflow + old_position * price
+        flipped = old_position * new_position < 0
+        if old_position != 0 and (new_position == 0 or flipped):
+            self._close_round_trip(flat_equity)
+        if new_position != 0 and (old_position == 0 or flipped):
+            self._open_equity = flat_equity
+            self._open_time = self.last_time
+        self.last_position = new_position
+        return None
+
+    def _add_return(self, value: float) -> None:
+        self.n_returns += 1
+        delta = value - self.mean_return
+        self.mean_return += delta / self.n_returns
+        self._m2 += delta * (value - self.mean_return)
+        if value < 0:
+            self._downside_sq += value * value
+        return None
+
+    def _close_round_trip(self, equity: float) -> None:
+        if self._open_equity is None:
+            return None
+        if equity - self._open_equity > 0:
+            self.wins += 1
+        else:
+            self.losses += 1
+        if self._open_time is not None and self.last_time is not None:
+            self.total_holding_time += self.last_time - self._open_time
+        self._open_equity = self._open_time = None
+        return None
+
+    @property
+    def variance(self) -> float:
+        """
+        Sample variance of the per-interval returns
+        """
+        if self.n_returns < 2:
+            return float("nan")
+        return self._m2 / (self.n_returns - 1)
+
+    @property
+    def annualization(self) -> float:
+        if self.periods_per_year is not None:
+            return math.sqrt(self.periods_per_year)
+        if self.uses_timestamps and self.total_time > 0:
+            return math.sqrt(SECONDS_PER_YEAR * self.n_returns / self.total_time)
+        return 1.0
+
+    @property
+    def sharpe(self) -> float:
+        std = math.sqrt(self.variance) if self.n_returns > 1 else float("nan")
+        if not std > 0:
+            return float("nan")
+        return self.mean_return / std * self.annualization
+
+    @property
+    def sortino(self) -> float:
+        if self.n_returns < 2 or self._downside_sq == 0:
+            return float("nan")
+        downside_dev = math.sqrt(self._downside_sq / self.n_returns)
+        return self.mean_return / downside_dev * self.annualization
+
+    @property
+    def round_trips(self) -> int:
+        return self.wins + self.losses
+
+    @property
+    def hit_rate(self) -> float:
+        return self.wins / self.round_trips if self.round_trips else float("nan")
+
+    @property
+    def avg_holding_time(self) -> float:
+        if not self.round_trips:
+            return float("nan")
+        return self.total_holding_time / self.round_trips
+
+    @property
+    def exposure(self) -> float:
+        """
+        Share of the elapsed time with an open position
+        """
+        if self.total_time == 0:
+            return float("nan")
+        return self.time_in_market / self.total_time
+
+    def summary(self) -> dict:
+        return dict(
+            drawdown=self.drawdown,
+            max_drawdown=self.max_drawdown,
+            mean_return=self.mean_return,
+            variance=self.variance,
+            sharpe=self.sharpe,
+            sortino=self.sortino,
+            wins=self.wins,
+            losses=self.losses,
+            hit_rate=self.hit_rate,
+            avg_holding_time=self.avg_holding_time,
+            time_in_market=self.time_in_market,
+            exposure=self.exposure,
+        )
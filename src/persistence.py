@@ -0,0 +1,185 @@
+"""
+Checkpointing of strategy/backtest state and recording of market data
+--> allows a warm restart without losing rolling windows, positions and pnl
+--> the history file is rotated once it reaches max_bytes, so reading the
+    latest records on a restart takes bounded time
+"""
+import os
+import time
+import pickle
+import logging
+import tempfile
+from collections import deque
+
+#### setup
+logger = logging.getLogger(__name__)
+
+#### constants
+CHECKPOINT_VERSION = 1
+PICKLE_PROTOCOL = pickle.HIGHEST_PROTOCOL
+HISTORY_MAX_BYTES = 100 * 2**20  # about 2000 snapshots with 720 ohlc rows
+# raised by pickle.load for corrupt files or after code changes
+UNPICKLE_ERRORS = (
+    pickle.UnpicklingError,
+    EOFError,
+    AttributeError,
+    ValueError,
+    TypeError,
+    ImportError,
+    IndexError,
+)
+
+
+#### functions
+def write_atomic(path: str, obj) -> None:
+    """
+    Pickle obj into a temporary file next to path and move it into
+    place afterwards. Readers either see the old or the new file, never
+    a partially written one
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp_checkpoint_")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(obj, f, protocol=PICKLE_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return None
+
+
+def save_checkpoint(path: str, strategy, engine) -> None:
+    """
+    Write the current state of strategy and backtest engine to disk
+    """
+    checkpoint = dict(
+        version=CHECKPOINT_VERSION,
+        created=time.time(),
+        strategy_cls=type(strategy).__name__,
+        strategy=strategy.get_state(),
+        engine=engine.get_state(),
+    )
+    write_atomic(path, checkpoint)
+    logger.debug(f"Saved checkpoint to {path}")
+    return None
+
+
+def load_checkpoint(path: str, strategy, engine) -> bool:
+    """
+    Restore strategy and backtest engine from a checkpoint file.
+    Returns False if there is no usable checkpoint
+    """
+    if not os.path.exists(path):
+        logger.info(f"No checkpoint found at {path}")
+        return False
+
+    try:
+        with open(path, "rb") as f:
+            checkpoint = pickle.load(f)
+    except UNPICKLE_ERRORS as e:
+        logger.warning(f"Could not read checkpoint {path}, cold start: {e!r}")
+        return False
+
+    if not isinstance(checkpoint, dict):
+        logger.warning(f"Checkpoint {path} has unexpected type {type(checkpoint)}")
+        return False
+    if checkpoint.get("version") != CHECKPOINT_VERSION:
+        logger.warning(f"Checkpoint version mismatch: {checkpoint.get('version')}")
+        return False
+    if checkpoint.get("strategy_cls") != type(strategy).__name__:
+        logger.warning(
+            f"Checkpoint belongs to {checkpoint.get('strategy_cls')}, "
+            f"not {type(strategy).__name__}"
+        )
+        return False
+
+    strategy.set_state(checkpoint["strategy"])
+    engine.set_state(checkpoint["engine"])
+    logger.info(f"Restored checkpoint from {path}")
+    return True
+
+
+def record_market_state(
+    path: str, market_state: dict, max_bytes: int = HISTORY_MAX_BYTES
+) -> None:
+    """
+    Append one market snapshot to a binary history file. Once the file
+    reaches max_bytes it replaces the previous file at rotated_path(path)
+    and a new file is started (None: never rotate)
+    """
+    with open(path, "ab") as f:
+        pickle.dump(market_state, f, protocol=PICKLE_PROTOCOL)
+        size = f.tell()
+    if max_bytes is not None and size >= max_bytes:
+        os.replace(path, rotated_path(path))
+        logger.info(f"Rotated history {path} after {size} bytes")
+    return None
+
+
+def rotated_path(path: str) -> str:
+    return f"{path}.1"
+
+
+def load_history(path: str, max_records: int = None) -> list:
+    """
+    Read recorded market snapshots (oldest first) of the rotated and the
+    current history file. If max_records is given, only the most recent
+    records are returned
+    """
+    history = deque(maxlen=max_records)
+    for file_path in (rotated_path(path), path):
+        if os.path.exists(file_path):
+            _read_records(file_path, history)
+    return list(history)
+
+
+def _read_records(path: str, history: deque) -> None:
+    """
+    Append all records of a history file to history
+    """
+    with open(path, "rb") as f:
+        while True:
+            try:
+                history.append(pickle.load(f))
+            except EOFError:
+                break
+            except UNPICKLE_ERRORS as e:
+                # truncated last record, e.g. after a crash during a write
+                logger.warning(
+                    f"Stopped reading history {path} at corrupt record: {e!r}"
+                )
+                break
+    return None
+
+
+class Checkpointer:
+    """
+    Write checkpoints periodically. Call maybe_save once per iteration
+    """
+
+    def __init__(self, path: str, interval_seconds: float = 60):
+        self.path = path
+        self.interval_seconds = interval_seconds
+        self._last_save = time.monotonic()
+
+    def maybe_save(self, strategy, engine) -> bool:
+        """
+        Save a checkpoint if the interval has passed since the last one
+        """
+        now = time.monotonic()
+        if now - self._last_save < self.interval_seconds:
+            return False
+        self.save(strategy, engine)
+        return True
+
+    def save(self, strategy, engine) -> None:
+        save_checkpoint(self.path, strategy, engine)
+        self._last_save = time.monotonic()
+        return None
+
+    def restore(self, strategy, engine) -> bool:
+        return load_checkpoint(self.path, strategy, engine)
@@ -0,0 +1,306 @@
+"""
+Profiling hooks for running instances
+--> aggregated call counts and timings per function (no per call output)
+--> cProfile or stack sampling for N iterations of the main loop, switched
+    on via environment variable or signal and dumped to disk
+"""
+import os
+import sys
+import time
+import signal
+import pstats
+import logging
+import cProfile
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from functools import wraps
+
+import numpy as np
+
+#### setup
+logger = logging.getLogger(__name__)
+
+#### constants
+N_RECENT = 1024  # samples kept per name to calculate percentiles
+PERCENTILES = (50, 90, 99)
+ENV_PROFILE = "ARTHUR_PROFILE"  # e.g. "cprofile:50" or "sample:100"
+ENV_PROFILE_DIR = "ARTHUR_PROFILE_DIR"
+DEFAULT_ITERATIONS = 100
+
+
+class TimingRegistry:
+    """
+    Call count, cumulative time and recent durations per name
+    """
+
+    def __init__(self, n_recent: int = N_RECENT):
+        self.n_recent = n_recent
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, seconds: float) -> None:
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                # count, total seconds, ring buffer of recent durations
+                stats = self._stats[name] = [0, 0.0, np.empty(self.n_recent)]
+            stats[2][stats[0] % self.n_recent] = seconds
+            stats[0] += 1
+            stats[1] += seconds
+        return None
+
+    def reset(self) -> None:
+        with self._lock:
+            self._stats.clear()
+        return None
+
+    def snapshot(self) -> dict:
+        """
+        Call count and total seconds per name, pass to report(since=...)
+        to get the statistics of the calls made afterwards
+        """
+        with self._lock:
+            return {name: (stats[0], stats[1]) for name, stats in self._stats.items()}
+
+    def report(self, since: dict = None) -> dict:
+        """
+        Dict name -> count, total, mean and percentiles (in seconds)
+        of the most recent calls. since: only calls after this snapshot
+        """
+        since = since or {}
+        items = []
+        with self._lock:
+            for name, (count, total, recent) in self._stats.items():
+                count_before, total_before = since.get(name, (0, 0.0))
+                n_calls = count - count_before
+                if n_calls <= 0:
+                    continue
+                # most recent durations in the ring buffer, oldest first
+                n_recent = min(n_calls, self.n_recent)
+                idx = np.arange(count - n_recent, count) % self.n_recent
+                items.append((name, n_calls, total - total_before, recent[idx]))
+        report = {}
+        for name, count, total, recent in items:
+            percentiles = np.percentile(recent, PERCENTILES)
+            report[name] = dict(
+                count=count,
+                total=total,
+                mean=total / count,
+                **{f"p{p}": value for p, value in zip(PERCENTILES, percentiles)},
+            )
+        return report
+
+    def format_report(self, since: dict = None) -> str:
+        """
+        Report as text table sorted by total time
+        """
+        columns = ["count", "total", "mean"] + [f"p{p}" for p in PERCENTILES]
+        lines = [f"{'name':<50}" + "".join(f"{c:>12}" for c in columns)]
+        report = sorted(self.report(since).items(), key=lambda x: -x[1]["total"])
+        for name, stats in report:
+            values = f"{stats['count']:>12}" + "".join(
+                f"{stats[c]:>12.6f}" for c in columns[1:]
+            )
+            lines.append(f"{name:<50}{values}")
+        return "\n".join(lines)
+
+
+# process wide default registry
+TIMINGS = TimingRegistry()
+
+
+def timed(
+    func=None,
+    name: str = None,
+    registry: TimingRegistry = TIMINGS,
+    per_class: bool = False,
+):
+    """
+    Decorator recording the duration of every call in the registry.
+    Use as @timed or @timed(name="..."). per_class: methods inherited by
+    subclasses are recorded per class of self, e.g. "module.Sub.method"
+    """
+
+    def decorator(func):
+        key = name or f"{func.__module__}.{func.__qualname__}"
+
+        @wraps(func)
+        def wrap(*args, **kwargs):
+            ts = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                if per_class:
+                    cls_name = type(args[0]).__name__
+                    record_key = f"{func.__module__}.{cls_name}.{func.__name__}"
+                else:
+                    record_key = key
+                registry.record(record_key, time.perf_counter() - ts)
+
+        return wrap
+
+    return decorator(func) if func is not None else decorator
+
+
+@contextmanager
+def timer(name: str, registry: TimingRegistry = TIMINGS):
+    """
+    Context manager recording the duration of the block in the registry
+    """
+    ts = time.perf_counter()
+    try:
+        yield
+    finally:
+        registry.record(name, time.perf_counter() - ts)
+
+
+class StackSampler:
+    """
+    Periodically sample the stack of one thread from a background thread
+    and count the collapsed stacks (flamegraph 'folded' format)
+    """
+
+    def __init__(self, interval_seconds: float = 0.005, thread_id: int = None):
+        self.interval_seconds = interval_seconds
+        self.thread_id = thread_id or threading.main_thread().ident
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return None
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_seconds):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[";".join(reversed(stack))] += 1
+        return None
+
+    def dump(self, path: str) -> None:
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return None
+
+
+class LoopProfiler:
+    """
+    Profile the next N iterations of the main loop on request:
+    --> environment variable ARTHUR_PROFILE=<cprofile|sample>[:iterations]
+        at startup
+    --> SIGUSR1 (cprofile) or SIGUSR2 (sample) while running
+    Reports are written to ARTHUR_PROFILE_DIR (default ./profiles)
+    """
+
+    def __init__(self, output_dir: str = None, iterations: int = DEFAULT_ITERATIONS):
+        self.output_dir = output_dir or os.environ.get(ENV_PROFILE_DIR, "profiles")
+        self.iterations = iterations
+        self._requested = None
+        self._mode = None
+        self._remaining = 0
+        self._profiler = None
+        self._timings_start = None
+        self._request_from_env()
+
+    def _request_from_env(self) -> None:
+        setting = os.environ.get(ENV_PROFILE)
+        if not setting:
+            return None
+        mode, _, iterations = setting.partition(":")
+        try:
+            iterations = int(iterations) if iterations else self.iterations
+        except ValueError:
+            logger.warning(f"Invalid {ENV_PROFILE}={setting!r}, profiling disabled")
+            return None
+        self.request(mode, iterations)
+        return None
+
+    def request(self, mode: str, iterations: int = None) -> None:
+        """
+        Profile the next iterations with mode 'cprofile' or 'sample'.
+        Only sets a flag, so it is safe to call from a signal handler
+        """
+        if mode not in ("cprofile", "sample"):
+            logger.warning(f"Unknown profiling mode: {mode}")
+            return None
+        self._requested = (mode, iterations or self.iterations)
+        return None
+
+    def install_signal_handlers(self) -> None:
+        if hasattr(signal, "SIGUSR1"):
+            signal.signal(signal.SIGUSR1, lambda *_: self.request("cprofile"))
+            signal.signal(signal.SIGUSR2, lambda *_: self.request("sample"))
+        return None
+
+    @property
+    def active(self) -> bool:
+        return self._mode is not None
+
+    @contextmanager
+    def iteration(self):
+        """
+        Wrap one iteration of the main loop
+        """
+        if self._requested is not None and not self.active:
+            self._start(*self._requested)
+            self._requested = None
+        if self._mode == "cprofile":
+            self._profiler.enable()
+        try:
+            yield
+        finally:
+            if self._mode == "cprofile":
+                self._profiler.disable()
+            if self.active:
+                self._remaining -= 1
+                if self._remaining <= 0:
+                    self._finish()
+
+    def _start(self, mode: str, iterations: int) -> None:
+        logger.info(f"Start profiling ({mode}) for {iterations} iterations")
+        self._mode = mode
+        self._remaining = iterations
+        if mode == "cprofile":
+            self._profiler = cProfile.Profile()
+        else:
+            self._profiler = StackSampler()
+            self._profiler.start()
+        # timing report written at the end covers only the profiled
+        # iterations, the aggregated timings of the process are kept
+        self._timings_start = TIMINGS.snapshot()
+        return None
+
+    def _finish(self) -> None:
+        os.makedirs(self.output_dir, exist_ok=True)
+        prefix = os.path.join(
+            self.output_dir, f"{time.strftime('%Y%m%d_%H%M%S')}_{self._mode}"
+        )
+        if self._mode == "cprofile":
+            self._profiler.dump_stats(f"{prefix}.prof")
+            with open(f"{prefix}.txt", "w") as f:
+                stats = pstats.Stats(self._profiler, stream=f)
+                stats.sort_stats("cumulative").print_stats(50)
+        else:
+            self._profiler.stop()
+            self._profiler.dump(f"{prefix}.folded")
+        with open(f"{prefix}_timings.txt", "w") as f:
+            f.write(TIMINGS.format_report(since=self._timings_start))
+        logger.info(f"Wrote profiling reports to {prefix}*")
+        self._mode, self._profiler = None, None
+        return None
@@ -0,0 +1,153 @@
+"""
+TTL cache for responses of the public kraken api
+--> identical requests within the TTL of an endpoint are served from memory
+--> concurrent identical requests are coalesced into one call (single-flight)
+"""
+import time
+import logging
+import threading
+
+import metrics
+
+#### setup
+logger = logging.getLogger(__name__)
+CACHE_EVENTS = metrics.REGISTRY.counter(
+    "arthur_cache_events_total", "Response cache hits, misses and coalesced calls"
+)
+
+#### constants
+DEFAULT_TTLS = {
+    "Time": 0,  # clock sync needs fresh samples
+    "Depth": 0.25,
+    "Ticker": 0.25,
+    "Trades": 0.25,
+    "OHLC": 2,
+}
+
+
+class _InFlight:
+    """
+    Result of a request that is currently executed by another thread
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.response = None
+        self.fetched_at = None
+        self.exception = None
+
+
+class ResponseCache:
+    def __init__(
+        self,
+        ttls: dict = None,
+        default_ttl: float = 0,
+        max_entries: int = 1024,
+        time_fn=time.monotonic,
+    ):
+        """
+        ttls: time to live in seconds per endpoint, 0 disables caching
+            (identical in-flight requests are still coalesced)
+        """
+        self.ttls = dict(DEFAULT_TTLS if ttls is None else ttls)
+        self.default_ttl = default_ttl
+        self.max_entries = max_entries
+        self.time_fn = time_fn
+        self._entries = {}
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._stats = dict(hit=0, miss=0, coalesced=0)
+        # fetch time of the response last returned to each thread
+        self._local = threading.local()
+
+    def set_ttl(self, endpoint: str, ttl: float) -> None:
+        self.ttls[endpoint] = ttl
+        return None
+
+    @property
+    def stats(self) -> dict:
+        """
+        Number of hits, misses and coalesced calls
+        """
+        with self._lock:
+            return dict(self._stats)
+
+    def last_age(self) -> float:
+        """
+        Seconds since the response last returned to the calling thread was
+        fetched from the api (> 0 if it was served from the cache)
+        """
+        fetched_at = getattr(self._local, "fetched_at", None)
+        return 0.0 if fetched_at is None else self.time_fn() - fetched_at
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+        return None
+
+    def get_or_fetch(self, endpoint: str, payload: dict, fetch) -> dict:
+        """
+        Return a cached response for endpoint/payload or call fetch().
+        Responses with errors are never cached. The returned dict is
+        shared between callers and must not be modified
+        """
+        key = (endpoint, tuple(sorted((payload or {}).items())))
+        now = self.time_fn()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            is_hit = entry is not None and entry[0] > now
+            if not is_hit:
+                call = self._in_flight.get(key)
+                is_leader = call is None
+                if is_leader:
+                    call = self._in_flight[key] = _InFlight()
+
+        if is_hit:
+            return self._count("hit", endpoint, entry[1], entry[2])
+        if not is_leader:
+            call.done.wait()
+            if call.exception is not None:
+                raise call.exception
+            return self._count("coalesced", endpoint, call.response, call.fetched_at)
+
+        try:
+            call.response = fetch()
+        except BaseException as e:
+            call.exception = e
+            raise
+        finally:
+            call.fetched_at = self.time_fn()
+            with self._lock:
+                del self._in_flight[key]
+                ttl = self.ttls.get(endpoint, self.default_ttl)
+                if (
+                    call.exception is None
+                    and ttl > 0
+                    and not call.response.get("error")
+                ):
+                    self._store(key, call.fetched_at + ttl, call)
+            call.done.set()
+        return self._count("miss", endpoint, call.response, call.fetched_at)
+
+    def _store(self, key: tuple, expires: float, call: _InFlight) -> None:
+        """
+        Add entry, purging expired ones once the cache is full.
+        Needs to be called with the lock held
+        """
+        if len(self._entries) >= self.max_entries:
+            now = self.time_fn()
+            self._entries = {k: v for k, v in self._entries.items() if v[0] > now}
+            if len(self._entries) >= self.max_entries:
+                self._entries.clear()
+        self._entries[key] = (expires, call.response, call.fetched_at)
+        return None
+
+    def _count(
+        self, event: str, endpoint: str, response: dict, fetched_at: float
+    ) -> dict:
+        self._local.fetched_at = fetched_at
+        with self._lock:
+            self._stats[event] += 1
+        CACHE_EVENTS.inc(endpoint=endpoint, result=event)
+        return response
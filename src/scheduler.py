@@ -0,0 +1,60 @@
+"""
+Fixed rate scheduling of the main loop
+--> slots that were missed because an iteration overran are skipped
+    instead of being run back to back
+"""
+import time
+import logging
+
+import metrics
+
+#### setup
+logger = logging.getLogger(__name__)
+MISSED_SLOTS = metrics.REGISTRY.counter(
+    "arthur_missed_slots_total", "Iteration slots skipped after an overrun"
+)
+
+
+class Scheduler:
+    """
+    Start an iteration every interval_seconds, 0 disables pacing
+    (iterations run back to back without deadline)
+    """
+
+    def __init__(
+        self, interval_seconds: float, time_fn=time.monotonic, sleep_fn=time.sleep
+    ):
+        self.interval_seconds = interval_seconds
+        self.time_fn = time_fn
+        self.sleep_fn = sleep_fn
+        self.next_slot = time_fn()
+        self.missed_slots = 0
+
+    @property
+    def deadline(self) -> float:
+        """
+        End of the current slot (time.monotonic), used as latency budget
+        of the running iteration. None without pacing
+        """
+        if self.interval_seconds <= 0:
+            return None
+        return self.next_slot + self.interval_seconds
+
+    def wait(self) -> int:
+        """
+        Sleep until the start of the next slot. Returns the number of
+        skipped slots
+        """
+        if self.interval_seconds <= 0:
+            return 0
+        self.next_slot += self.interval_seconds
+        now = self.time_fn()
+        missed = 0
+        if now > self.next_slot:
+            missed = int((now - self.next_slot) // self.interval_seconds) + 1
+            self.next_slot += missed * self.interval_seconds
+            self.missed_slots += missed
+            MISSED_SLOTS.inc(missed)
+            logger.warning(f"Iteration overran, skipping {missed} slot(s)")
+        self.sleep_fn(self.next_slot - now)
+        return missed
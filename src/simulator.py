@@ -0,0 +1,385 @@
+"""
+Synthetic market data and a local stand-in for the public Kraken api
+--> random walk price process with order book, trades and OHLC bars
+--> http server mimicking the Time/Depth/OHLC/Trades/Ticker responses,
+    including error payloads and rate limiting
+"""
+import json
+import time
+import random
+import logging
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+
+#### setup
+logger = logging.getLogger(__name__)
+
+#### constants
+RFC1123_FMT = "%a, %d %b %y %H:%M:%S +0000"
+N_OHLC_BARS = 720  # kraken returns the latest 720 bars
+N_TRADES = 1000  # kraken returns up to 1000 trades
+
+
+class SyntheticMarket:
+    """
+    One pair with a geometric random walk mid price. The order book is
+    built around the mid price with a depth profile, trades arrive as
+    poisson process and are aggregated into 1 minute OHLC bars
+    """
+
+    def __init__(
+        self,
+        start_price: float = 100.0,
+        volatility: float = 0.0005,
+        spread: float = 0.0002,
+        tick_size: float = 0.01,
+        n_levels: int = 100,
+        level_volume: float = 1.0,
+        depth_slope: float = 0.05,
+        trade_rate: float = 2.0,
+        seed: int = None,
+        time_fn=time.time,
+    ):
+        """
+        volatility: standard deviation of log returns per second
+        spread: relative distance between best bid and best ask
+        depth_slope: relative increase of the volume per level
+        trade_rate: expected number of trades per second
+        """
+        self.volatility = volatility
+        self.spread = spread
+        self.tick_size = tick_size
+        self.n_levels = n_levels
+        self.level_volume = level_volume
+        self.depth_slope = depth_slope
+        self.trade_rate = trade_rate
+        self.time_fn = time_fn
+        self.rng = np.random.default_rng(seed)
+        self.lock = threading.Lock()
+
+        self.now = time_fn()
+        self.mid = start_price
+        self.trades = deque(maxlen=N_TRADES)
+        # bar: [timestamp, open, high, low, close, price*volume, volume, count]
+        self.bars = deque(maxlen=N_OHLC_BARS)
+        self._init_bars()
+
+    def _init_bars(self) -> None:
+        """
+        Backfill bars for the last N_OHLC_BARS minutes so that indicators
+        have history from the start. The walk ends at the start price
+        """
+        first_bar = int(self.now // 60) * 60 - 60 * (N_OHLC_BARS - 1)
+        returns = self.rng.normal(0, self.volatility * np.sqrt(60), N_OHLC_BARS)
+        closes = self.mid * np.exp(np.cumsum(returns) - np.sum(returns))
+        opens = np.concatenate([[closes[0]], closes[:-1]])
+        wiggle = np.abs(self.rng.normal(0, self.volatility * np.sqrt(30), N_OHLC_BARS))
+        highs = np.maximum(opens, closes) * (1 + wiggle)
+        lows = np.minimum(opens, closes) * (1 - wiggle)
+        volumes = self.rng.exponential(self.level_volume, N_OHLC_BARS) * 10
+        for i in range(N_OHLC_BARS - 1):
+            vwap = (opens[i] + closes[i]) / 2
+            self.bars.append(
+                [
+                    first_bar + 60 * i,
+                    opens[i],
+                    highs[i],
+                    lows[i],
+                    closes[i],
+                    vwap * volumes[i],
+                    volumes[i],
+                    10,
+                ]
+            )
+        # current bar starts without trades at the start price
+        self.bars.append(
+            [first_bar + 60 * (N_OHLC_BARS - 1)] + [self.mid] * 4 + [0.0, 0.0, 0]
+        )
+        return None
+
+    def advance(self, now: float = None) -> None:
+        """
+        Evolve the market until now
+        """
+        now = self.time_fn() if now is None else now
+        dt = now - self.now
+        if dt <= 0:
+            return None
+
+        n_trades = self.rng.poisson(self.trade_rate * dt)
+        times = np.sort(self.rng.uniform(self.now, now, n_trades))
+        # random walk between trade times, last step up to now
+        steps = np.diff(np.concatenate([[self.now], times, [now]]))
+        returns = self.rng.normal(0, self.volatility * np.sqrt(steps))
+        mids = self.mid * np.exp(np.cumsum(returns))
+
+        for trade_time, mid in zip(times, mids[:-1]):
+            side = "b" if self.rng.random() < 0.5 else "s"
+            order_type = "m" if self.rng.random() < 0.7 else "l"
+            half_spread = mid * self.spread / 2
+            price = mid + half_spread if side == "b" else mid - half_spread
+            volume = self.rng.exponential(self.level_volume / 4)
+            self._add_trade(trade_time, round(price, 8), volume, side, order_type)
+
+        self.mid = mids[-1]
+        self.now = now
+        self._roll_bars(now)
+        return None
+
+    def _roll_bars(self, now: float) -> None:
+        """
+        Open new (empty) bars up to the current minute
+        """
+        current_bar = int(now // 60) * 60
+        while self.bars[-1][0] < current_bar:
+            close = self.bars[-1][4]
+            self.bars.append([self.bars[-1][0] + 60] + [close] * 4 + [0.0, 0.0, 0])
+        return None
+
+    def _add_trade(self, trade_time, price, volume, side, order_type) -> None:
+        self._roll_bars(trade_time)
+        self.trades.append((price, volume, trade_time, side, order_type, ""))
+        bar = self.bars[-1]
+        if bar[7] == 0:
+            bar[1] = price
+        bar[2] = max(bar[2], price)
+        bar[3] = min(bar[3], price)
+        bar[4] = price
+        bar[5] += price * volume
+        bar[6] += volume
+        bar[7] += 1
+        return None
+
+    @property
+    def best_bid(self) -> float:
+        return self._round_down(self.mid * (1 - self.spread / 2))
+
+    @property
+    def best_ask(self) -> float:
+        best_ask = self._round_up(self.mid * (1 + self.spread / 2))
+        return max(best_ask, self.best_bid + self.tick_size)
+
+    def _round_down(self, price: float) -> float:
+        return np.floor(price / self.tick_size) * self.tick_size
+
+    def _round_up(self, price: float) -> float:
+        return np.ceil(price / self.tick_size) * self.tick_size
+
+    def depth(self, count: int = 100) -> dict:
+        """
+        Order book in the format of the Depth endpoint
+        """
+        n = min(count, self.n_levels)
+        steps = np.arange(n) * self.tick_size
+        profile = self.level_volume * (1 + self.depth_slope * np.arange(n))
+        bid_volume = profile * self.rng.lognormal(0, 0.5, n)
+        ask_volume = profile * self.rng.lognormal(0, 0.5, n)
+        ts = int(self.now)
+        return dict(
+            bids=[
+                [f"{p:.5f}", f"{v:.8f}", ts]
+                for p, v in zip(self.best_bid - steps, bid_volume)
+            ],
+            asks=[
+                [f"{p:.5f}", f"{v:.8f}", ts]
+                for p, v in zip(self.best_ask + steps, ask_volume)
+            ],
+        )
+
+    def ohlc(self, since: float = None) -> tuple:
+        """
+        Bars in the format of the OHLC endpoint and the 'last' cursor
+        """
+        rows = [
+            [
+                bar[0],
+                f"{bar[1]:.5f}",
+                f"{bar[2]:.5f}",
+                f"{bar[3]:.5f}",
+                f"{bar[4]:.5f}",
+                f"{bar[5] / bar[6] if bar[6] else bar[4]:.5f}",
+                f"{bar[6]:.8f}",
+                bar[7],
+            ]
+            for bar in self.bars
+            if since is None or bar[0] > since
+        ]
+        return rows, self.bars[-2][0]
+
+    def last_trades(self, since: float = None) -> tuple:
+        """
+        Trades in the format of the Trades endpoint and the 'last' cursor
+        (nanoseconds, like kraken)
+        """
+        rows = [
+            [f"{t[0]:.5f}", f"{t[1]:.8f}", t[2], t[3], t[4], t[5]]
+            for t in self.trades
+            if since is None or t[2] * 1e9 > since
+        ]
+        last = self.trades[-1][2] if self.trades else self.now
+        return rows, str(int(last * 1e9))
+
+    def ticker(self) -> dict:
+        """
+        Top of book in the format of the Ticker endpoint
+        """
+        last = self.trades[-1] if self.trades else (self.mid, 0.0)
+        return dict(
+            a=[f"{self.best_ask:.5f}", "1", "1.000"],
+            b=[f"{self.best_bid:.5f}", "1", "1.000"],
+            c=[f"{last[0]:.5f}", f"{last[1]:.8f}"],
+        )
+
+
+class TokenBucket:
+    """
+    Rate limiter: rate tokens per second, at most burst tokens stored
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self) -> bool:
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class KrakenStandIn:
+    """
+    Local http server answering public api requests from synthetic markets
+    """
+
+    def __init__(
+        self,
+        markets: dict,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        error_rate: float = 0.0,
+        rate_limit: tuple = None,
+        latency: float = 0.0,
+    ):
+        """
+        markets: dict pair -> SyntheticMarket
+        error_rate: share of requests answered with an error (half of them
+            as http 500, half as kraken error payload)
+        rate_limit: (requests per second, burst) or None
+        latency: artificial delay of every response in seconds
+        """
+        self.markets = markets
+        self.error_rate = error_rate
+        self.latency = latency
+        self.rate_limiter = TokenBucket(*rate_limit) if rate_limit else None
+        self.request_count = 0
+        self._count_lock = threading.Lock()  # handlers run in threads
+        self.server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/0/public"
+
+    def start(self) -> "KrakenStandIn":
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        logger.info(f"Kraken stand-in listening on {self.url}")
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        return None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def handle(self, endpoint: str, params: dict) -> tuple:
+        """
+        Return (status code, response body) for a request
+        """
+        with self._count_lock:
+            self.request_count += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self.rate_limiter is not None and not self.rate_limiter.take():
+            return 200, dict(error=["EAPI:Rate limit exceeded"])
+        if self.error_rate and random.random() < self.error_rate:
+            if random.random() < 0.5:
+                return 500, dict(error=["EService:Unavailable"])
+            return 200, dict(error=["EService:Busy"])
+
+        if endpoint == "Time":
+            now = time.time()
+            result = dict(
+                unixtime=int(now), rfc1123=time.strftime(RFC1123_FMT, time.gmtime(now))
+            )
+            return 200, dict(error=[], result=result)
+
+        pairs = params.get("pair", "").split(",")
+        if endpoint not in ("Depth", "OHLC", "Trades", "Ticker"):
+            return 404, dict(error=["EGeneral:Unknown method"])
+        if not all(pair in self.markets for pair in pairs):
+            return 200, dict(error=["EQuery:Unknown asset pair"])
+
+        result = {}
+        for pair in pairs:
+            market = self.markets[pair]
+            with market.lock:
+                market.advance()
+                if endpoint == "Depth":
+                    result[pair] = market.depth(int(params.get("count", 100)))
+                elif endpoint == "OHLC":
+                    since = params.get("since")
+                    result[pair], result["last"] = market.ohlc(
+                        float(since) if since else None
+                    )
+                elif endpoint == "Trades":
+                    since = params.get("since")
+                    result[pair], result["last"] = market.last_trades(
+                        float(since) if since else None
+                    )
+                else:
+                    result[pair] = market.ticker()
+        return 200, dict(error=[], result=result)
+
+    def _make_handler(self):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                endpoint = url.path.rstrip("/").split("/")[-1]
+                params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+                status, body = stand_in.handle(endpoint, params)
+                payload = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                logger.debug(format % args)
+
+        return Handler
@@ -1,6 +1,8 @@
+import copy
 import numpy as np
 import pandas as pd
 import utils as ut
+import profiling
 import logging
 import ta
 
@@ -13,6 +15,12 @@ class Strategy:
     signal, indicators and market state
     """
 
+    # attributes that are written to / restored from a checkpoint
+    _state_attrs = ("trade_signal", "_signals", "_indicators")
+
+    # whether the strategy needs the full order book or only best bid/ask
+    requires_depth = True
+
     def __init__(self, position_size, sleep_seconds):
         self.position_size = position_size
         self.sleep_seconds = sleep_seconds
@@ -21,6 +29,7 @@ class Strategy:
         self._indicators = dict()
         self.trade_signal = 0
 
+    @profiling.timed(per_class=True)
     def update_market_state(self, current_state):
         """
         Update state of the market
@@ -58,12 +67,39 @@ class Strategy:
         """
         return self.trade_signal * self.position_size
 
+    def get_state(self) -> dict:
+        """
+        Copy of all state needed for a warm restart
+        """
+        return {attr: copy.deepcopy(getattr(self, attr)) for attr in self._state_attrs}
+
+    def set_state(self, state: dict) -> None:
+        """
+        Restore state created by get_state
+        """
+        for attr in self._state_attrs:
+            if attr in state:
+                setattr(self, attr, copy.deepcopy(state[attr]))
+        return None
+
+    def prefill(self, history: list) -> None:
+        """
+        Replay recorded market snapshots (oldest first) to fill
+        rolling windows before trading starts
+        """
+        for market_state in history:
+            self.update_market_state(current_state=market_state)
+        logger.info(f"Prefilled strategy with {len(history)} recorded snapshots")
+        return None
+
 
 class SobiStrategy(Strategy):
     """
     Storing the current and historic Sobi signals
     """
 
+    _state_attrs = Strategy._state_attrs + ("last_signals", "last_imbalances")
+
     def __init__(self, window_size: int, theta: float, depth: int, **kwargs):
         super().__init__(**kwargs)
         self._signals = dict(current=0, rolling=0,)
@@ -141,6 +177,60 @@ class SobiStrategy(Strategy):
             self.trade_signal = self._signals["rolling"]
         pass
 
+    def batch_signals(self, features: np.array) -> np.array:
+        """
+        Sobi signals for a whole feature matrix at once, see
+        OrderBookSeries.features (needs the depth of this strategy).
+        Gives the same results as calling update_market_state for every
+        row in order, except that rolling imbalances are nan (and the
+        rolling signal 0) until the window is full. A nan imbalance only
+        affects the windows that contain it
+        """
+        imb_bid = features[f"imb_bid_{self._depth}"]
+        imb_ask = features[f"imb_ask_{self._depth}"]
+
+        # rolling means over the last window_size rows, one mean per window
+        rolling_imb_bid = np.full(len(features), np.nan)
+        rolling_imb_ask = np.full(len(features), np.nan)
+        w = self._window_size
+        if len(features) >= w:
+            for imb, rolling_imb in (
+                (imb_bid, rolling_imb_bid),
+                (imb_ask, rolling_imb_ask),
+            ):
+                windows = np.lib.stride_tricks.sliding_window_view(imb, w)
+                rolling_imb[w - 1 :] = windows.mean(axis=1)
+
+        current = self._calc_signals(imb_bid, imb_ask)
+        rolling = self._calc_signals(rolling_imb_bid, rolling_imb_ask)
+
+        signals = np.empty(
+            len(features),
+            dtype=[
+                ("imb_bid", float),
+                ("imb_ask", float),
+                ("rolling_imb_bid", float),
+                ("rolling_imb_ask", float),
+                ("current", np.int8),
+                ("rolling", np.int8),
+            ],
+        )
+        signals["imb_bid"], signals["imb_ask"] = imb_bid, imb_ask
+        signals["rolling_imb_bid"] = rolling_imb_bid
+        signals["rolling_imb_ask"] = rolling_imb_ask
+        signals["current"], signals["rolling"] = current, rolling
+        return signals
+
+    def _calc_signals(self, imb_bid: np.array, imb_ask: np.array) -> np.array:
+        """
+        Vectorized version of _calc_signal, nan imbalances give 0
+        """
+        return np.where(
+            (imb_ask - imb_bid) > self._theta,
+            1,
+            np.where((imb_bid - imb_ask) > self._theta, -1, 0),
+        )
+
     def _calc_rolling_imbalances(self) -> np.array:
         """
         calculate rolling bid and ask imbalances
@@ -173,6 +263,8 @@ class SobiStrategy(Strategy):
 
 
 class TrendStrategy(Strategy):
+    requires_depth = False
+
     def __init__(self, window_size, adx_threshold, **kwargs):
         super().__init__(**kwargs)
         self.window_size = window_size
@@ -223,6 +315,8 @@ class TrendStrategy(Strategy):
 
 
 class WilliamsrStrategy(Strategy):
+    requires_depth = False
+
     def __init__(self, window_size, wr_threshold):
         self.window_size = window_size
         self.indicators = dict(wr_idx=None)
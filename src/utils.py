@@ -5,8 +5,8 @@ import logging
 import numpy as np
 import pytz
 from datetime import datetime
-from functools import wraps
-from time import time
+
+import profiling
 
 #### setup
 logger = logging.getLogger(__name__)
@@ -41,12 +41,7 @@ def get_log_msg(results: dict) -> str:
 
 
 def timing(func):
-    @wraps(func)
-    def wrap(*args, **kwargs):
-        ts = time()
-        result = func(*args, **kwargs)
-        te = time()
-        print(f"func:{func.__name__} took: {te-ts:2.4f} sec")
-        return result
-
-    return wrap
+    """
+    Record call count and duration of func in profiling.TIMINGS
+    """
+    return profiling.timed(func)
@@ -0,0 +1,150 @@
+import os
+import sys
+
+package_directory = f"{os.getcwd()}//src"
+sys.path.append(package_directory)
+
+import pytest
+from backoff import (
+    CircuitOpenError,
+    DeadlineExceeded,
+    RetryLaterError,
+    RetryPolicy,
+    TransientError,
+)
+
+
+class FakeTime:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def make_policy(clock, **kwargs):
+    return RetryPolicy(time_fn=clock.time, sleep_fn=clock.sleep, seed=0, **kwargs)
+
+
+def failing(n_failures, clock=None, seconds_per_attempt=0.0):
+    calls = []
+
+    def fn(timeout):
+        calls.append(timeout)
+        if clock is not None:
+            clock.now += min(timeout, seconds_per_attempt)
+        if len(calls) <= n_failures:
+            raise TransientError({"error": ["EService:Unavailable"]})
+        return {"error": [], "result": len(calls)}
+
+    return fn, calls
+
+
+def test_retries_with_jittered_backoff():
+    clock = FakeTime()
+    policy = make_policy(clock, base_seconds=1, max_call_seconds=100)
+    fn, calls = failing(3)
+
+    assert policy.call("Depth", fn)["result"] == 4
+    # delay n is drawn from [0, base * 2**(n-1)]
+    assert [s <= 2**i for i, s in enumerate(clock.sleeps)] == [True] * 3
+    stats = policy.stats("Depth")
+    assert stats["retries"] == 3
+    assert stats["wait_seconds"] == pytest.approx(sum(clock.sleeps))
+    assert stats["consecutive_failures"] == 0
+
+
+def test_circuit_opens_fails_fast_and_recovers():
+    clock = FakeTime()
+    policy = make_policy(clock, max_attempts=1, failure_threshold=3, reset_seconds=10)
+    fn, calls = failing(4)
+    for _ in range(3):
+        with pytest.raises(TransientError):
+            policy.call("Depth", fn)
+
+    with pytest.raises(CircuitOpenError):
+        policy.call("Depth", fn)
+    assert len(calls) == 3
+    # other endpoints are not affected
+    assert policy.call("Ticker", lambda timeout: "ok") == "ok"
+
+    # failed probe reopens the circuit, successful probe closes it
+    clock.now += 10
+    with pytest.raises(TransientError):
+        policy.call("Depth", fn)
+    with pytest.raises(CircuitOpenError):
+        policy.call("Depth", fn)
+    clock.now += 10
+    assert policy.call("Depth", fn)["result"] == 5
+    assert not policy.stats("Depth")["circuit_open"]
+
+
+def test_budget_covers_attempts_not_only_waiting():
+    clock = FakeTime()
+    policy = make_policy(clock, base_seconds=0.01, max_call_seconds=5)
+    # every attempt hangs until its timeout
+    fn, calls = failing(10, clock=clock, seconds_per_attempt=100)
+
+    with pytest.raises(TransientError):
+        policy.call("Depth", fn)
+    assert len(calls) == 1
+    assert calls[0] == 5
+    assert clock.now == 5
+
+
+def test_deadline_limits_attempt_timeout_and_retries():
+    clock = FakeTime()
+    policy = make_policy(clock, base_seconds=0.01, max_call_seconds=100)
+    fn, calls = failing(10, clock=clock, seconds_per_attempt=1)
+
+    with pytest.raises(TransientError):
+        policy.call("Depth", fn, deadline=2.5)
+    assert clock.now <= 2.5
+    assert calls[0] == 2.5
+    assert all(timeout <= 2.5 for timeout in calls)
+
+    with pytest.raises(DeadlineExceeded):
+        policy.call("Depth", fn, deadline=clock.now)
+    assert len(calls) == 3
+
+
+def test_non_blocking_failing_pair_does_not_delay_others():
+    clock = FakeTime()
+    policy = make_policy(
+        clock, base_seconds=1, failure_threshold=2, reset_seconds=10, blocking=False
+    )
+    fn, calls = failing(100)
+
+    for _ in range(3):
+        # the failing pair is skipped, the other pair is served at once
+        with pytest.raises((TransientError, RetryLaterError, CircuitOpenError)):
+            policy.call("Depth", fn, pair="BAD")
+        assert policy.call("Depth", lambda timeout: "ok", pair="GOOD") == "ok"
+        clock.now += 1
+    assert clock.sleeps == []
+
+    # the circuit of the bad pair is open, the good pair is not affected
+    assert policy.stats("Depth", pair="BAD")["circuit_open"]
+    assert not policy.stats("Depth", pair="GOOD")["circuit_open"]
+    assert len(calls) == 2
+
+
+def test_non_blocking_retries_after_backoff_delay():
+    clock = FakeTime()
+    policy = make_policy(clock, base_seconds=1, blocking=False)
+    fn, calls = failing(1)
+
+    with pytest.raises(TransientError):
+        policy.call("Depth", fn, pair="A")
+    delay = policy.stats("Depth", pair="A")["wait_seconds"]
+    if delay > 0:
+        with pytest.raises(RetryLaterError):
+            policy.call("Depth", fn, pair="A")
+    clock.now += delay
+    assert policy.call("Depth", fn, pair="A")["result"] == 2
+    assert len(calls) == 2
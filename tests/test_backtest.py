@@ -0,0 +1,91 @@
+import os
+import sys
+package_directory = f"{os.getcwd()}//src"
+sys.path.append(package_directory)
+
+import numpy as np
+import kraken_client
+from backtest import Backtest
+from data_center import OrderBook
+
+
+def make_market_state(i):
+    bids = np.array([(99 + i, 1, 0)], dtype=kraken_client.ORDERBOOK_DTYPE)
+    asks = np.array([(100 + i, 1, 0)], dtype=kraken_client.ORDERBOOK_DTYPE)
+    return dict(time=f"t{i}", order_book=OrderBook(bids=bids, asks=asks))
+
+
+def test_fills_spill_to_order_log(tmp_path):
+    engine = Backtest(max_orders=2, order_log_path=str(tmp_path / "orders.bin"))
+    for i in range(5):
+        engine.update_market_state(make_market_state(i))
+        engine.rebalance_position(1 if i % 2 == 0 else -1)
+
+    assert len(engine.all_orders) == 2
+    assert engine.n_orders == 5
+    assert engine.total_turnover == 9
+
+    history = engine.get_order_history()
+    assert list(history["order_id"]) == [b"t0", b"t1", b"t2", b"t3", b"t4"]
+    assert np.isclose(history["cashflow"].sum(), engine.total_cashflow)
+    assert len(engine.read_order_log()) == 3
+
+
+def test_no_rebalance_on_stale_book():
+    engine = Backtest()
+    market_state = make_market_state(0)
+    market_state["stale"] = ("order_book",)
+    engine.update_market_state(market_state)
+    engine.rebalance_position(1)
+
+    assert engine.current_position == 0
+    assert engine.stale_skips == 1
+
+    engine.update_market_state(make_market_state(1))
+    engine.rebalance_position(1)
+    assert engine.current_position == 1
+
+
+def test_restore_checkpoint_without_running_totals():
+    # state as written before pnl and turnover were kept as running totals
+    old_state = dict(
+        current_position=0,
+        cashflows=[-100.0, 120.0],
+        turnover=[1, 1],
+        all_orders=["sell", "buy"],
+    )
+    engine = Backtest()
+    engine.set_state(old_state)
+
+    assert engine.get_current_profit() == 20
+    assert engine.get_total_turnover() == 2
+    assert engine.n_orders == 2
+
+
+def test_open_position_valued_at_last_book_when_dropped():
+    engine = Backtest()
+    engine.update_market_state(make_market_state(0))
+    engine.rebalance_position(1)
+
+    # stale book dropped by DataCenter(drop_stale=True)
+    engine.update_market_state(dict(time="t1", order_book=None, stale=("order_book",)))
+    engine.rebalance_position(0)
+    assert engine.current_position == 1
+    assert engine.get_current_profit() == -1
+
+
+def test_restored_open_position_valued_without_new_book():
+    engine = Backtest()
+    engine.update_market_state(make_market_state(0))
+    engine.rebalance_position(1)
+
+    restored = Backtest()
+    restored.set_state(engine.get_state())
+    assert restored.get_current_profit() == -1
+
+    # checkpoint written before the last order book was saved
+    state = engine.get_state()
+    del state["last_order_book"]
+    restored = Backtest()
+    restored.set_state(state)
+    assert restored.get_current_profit() == 0
@@ -0,0 +1,49 @@
+import os
+import sys
+package_directory = f"{os.getcwd()}//src"
+sys.path.append(package_directory)
+
+import clock
+import kraken_client
+
+
+def test_offset_narrows_with_samples(monkeypatch):
+    # local clock is 10.3 seconds behind the server, round trip 0.2s
+    local = {"t": 1000.0}
+
+    def fake_time():
+        local["t"] += 0.1
+        return local["t"]
+
+    def fake_server_time():
+        server_now = local["t"] + 10.3
+        return None, int(server_now)
+
+    monkeypatch.setattr(kraken_client, "get_server_time", fake_server_time)
+    server_clock = clock.ServerClock(time_fn=fake_time)
+
+    for _ in range(8):
+        assert server_clock.sync()
+        local["t"] += 0.37
+
+    assert abs(server_clock.offset - 10.3) < 0.3
+    assert abs(server_clock.delay - 0.1) < 1e-9
+    assert server_clock.rfc1123(0) == "Thu, 01 Jan 70 00:00:00 +0000"
+
+
+def test_failed_sync_is_retried(monkeypatch):
+    responses = [(None, None), (None, None), (None, 1000)]
+    calls = []
+
+    def fake_server_time():
+        calls.append(1)
+        return responses[min(len(calls), len(responses)) - 1]
+
+    monkeypatch.setattr(kraken_client, "get_server_time", fake_server_time)
+    server_clock = clock.ServerClock(retry_seconds=0)
+    for _ in range(5):
+        server_clock.now()
+
+    # two failed attempts, then synced and no further requests
+    assert len(calls) == 3
+    assert server_clock.is_synced
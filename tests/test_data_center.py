@@ -1,18 +1,22 @@
 import os
 import sys 
+import time
+import pickle
 package_directory = f"{os.getcwd()}//src" 
 sys.path.append(package_directory)
 
 import numpy as np
-import data_center 
+import data_center
+import kraken_client
+from backtest import Backtest
 
 ask_arr = np.array(
     [(21+x, 1, 999+x) for x in range(10)],
-    dtype=[("price", float), ("volume", float), ("timestamp", int)],
+    dtype=kraken_client.ORDERBOOK_DTYPE,
 )
 bid_arr = np.array(
     [(19-x, 1, 999-x) for x in range(10)],
-    dtype=[("price", float), ("volume", float), ("timestamp", int)],
+    dtype=kraken_client.ORDERBOOK_DTYPE,
 )
 
 def test_best_bidask():
@@ -32,3 +36,201 @@ def test_obwa():
 
 
 
+
+
+def test_orderbook_columns_reused():
+    bid_cols = data_center.allocate_book_columns(3)
+    ask_cols = data_center.allocate_book_columns(3)
+    raw = dict(
+        bids=[["18", "1", 1], ["19", "2", 2], ["17", "1", 3], ["16", "1", 4]],
+        asks=[["21", "1", 1], ["22", "1", 2]],
+    )
+    bids, asks = kraken_client.parse_orderbook_into_columns(raw, bid_cols, ask_cols)
+    orderbook = data_center.OrderBook(bids=bids, asks=asks)
+    assert orderbook.best_bid == 19
+    assert list(bids["price"]) == [19, 18, 17]
+    assert len(asks["price"]) == 2
+    assert np.shares_memory(bids["price"], bid_cols["price"])
+
+    snapshot = orderbook.snapshot()
+    raw["bids"] = [["10", "1", 5]]
+    kraken_client.parse_orderbook_into_columns(raw, bid_cols, ask_cols)
+    assert orderbook.best_bid == 10
+    assert snapshot.best_bid == 19
+
+
+def test_multi_pair_uses_one_ticker_request(monkeypatch):
+    ticker_calls = []
+
+    def fake_ticker(pairs, deadline=None):
+        ticker_calls.append(pairs)
+        quote = dict(a=["2", "1", "1"], b=["1", "1", "1"], c=["1.5", "1"])
+        raw = {pair: quote for pair in pairs}
+        return kraken_client.parse_ticker_into_arr(raw, pairs)
+
+    monkeypatch.setattr(kraken_client, "get_ticker", fake_ticker)
+    monkeypatch.setattr(
+        kraken_client, "get_orderbook", lambda **kwargs: (None, bid_arr, ask_arr)
+    )
+    monkeypatch.setattr(kraken_client, "get_server_time", lambda: (None, 1000))
+
+    center = data_center.MultiPairDataCenter(
+        pairs=["A", "B", "C"], depth_pairs=["C"], load_trades=False
+    )
+    market_data = center.get_market_data()
+
+    assert ticker_calls == [["A", "B"]]
+    assert market_data["A"]["order_book"].best_ask == 2
+    assert market_data["B"]["order_book"].midprice == 1.5
+    assert market_data["C"]["order_book"].best_bid == 19
+
+
+def test_multi_pair_missing_quote_is_stale(monkeypatch):
+    quote = dict(a=["2", "1", "1"], b=["1", "1", "1"], c=["1.5", "1"])
+    responses = [{"B": quote}, {"A": quote, "B": quote}]
+
+    def fake_ticker(pairs, deadline=None):
+        return kraken_client.parse_ticker_into_arr(responses.pop(0), pairs)
+
+    monkeypatch.setattr(kraken_client, "get_ticker", fake_ticker)
+    monkeypatch.setattr(kraken_client, "get_server_time", lambda: (None, 1000))
+    center = data_center.MultiPairDataCenter(pairs=["A", "B"], load_trades=False)
+    engine = Backtest()
+
+    market_data = center.get_market_data()
+    assert market_data["A"]["order_book"] is None
+    assert market_data["A"]["stale"] == ("order_book",)
+    assert market_data["B"]["stale"] == ()
+    engine.update_market_state(market_data["A"])
+    engine.rebalance_position(1)
+    assert engine.current_position == 0
+
+    engine.update_market_state(center.get_market_data()["A"])
+    engine.rebalance_position(1)
+    assert engine.current_position == 1
+    assert engine.get_current_profit() == -1
+
+
+def test_trades_parsed_into_compact_records():
+    trades = kraken_client.parse_lasttrades_into_arr(
+        [
+            ["100.5", "0.1", 1600000000.1234, "b", "m", ""],
+            ["100.0", "0.3", 1600000001.5, "s", "l", "ab", 42],
+            ["100.0", "0.3", 1600000002.0, "x", "?", ""],
+        ]
+    )
+    assert trades.dtype.hasobject is False
+    assert list(trades["direction"]) == [1, -1, kraken_client.UNKNOWN_DIRECTION]
+    assert list(trades["type"]) == [0, 1, kraken_client.UNKNOWN_TYPE]
+    assert kraken_client.decode_misc(trades["misc"][1]) == "ab"
+    assert trades["timestamp"][0] == 1600000000.1234
+    assert trades["trade_id"][1] == 42
+
+
+def test_trade_buffer_accumulates_and_computes_flow():
+    buffer = data_center.TradeBuffer(capacity=5)
+    for start in range(0, 12, 3):
+        trades = np.zeros(3, dtype=kraken_client.TRADES_DTYPE)
+        trades["timestamp"] = np.arange(start, start + 3)
+        trades["price"] = 100 + trades["timestamp"]
+        trades["volume"] = 1
+        trades["direction"] = np.where(trades["timestamp"] % 2, -1, 1)
+        buffer.extend(trades)
+
+    assert len(buffer) == 5
+    assert list(buffer.trades["timestamp"]) == [7, 8, 9, 10, 11]
+    # trades at 9, 10, 11
+    assert buffer.signed_volume(seconds=3) == -1
+    assert buffer.vwap(seconds=3) == 110
+
+
+def test_trade_buffer_pickles_only_buffered_trades():
+    buffer = data_center.TradeBuffer(capacity=10000)
+    trades = np.zeros(3, dtype=kraken_client.TRADES_DTYPE)
+    trades["timestamp"] = [1, 2, 3]
+    buffer.extend(trades)
+
+    data = pickle.dumps(buffer)
+    assert len(data) < 10 * trades.nbytes + 1000
+    restored = pickle.loads(data)
+    assert restored.capacity == 10000
+    assert list(restored.trades["timestamp"]) == [1, 2, 3]
+    restored.extend(trades)
+    assert len(restored) == 6
+
+
+def test_unsorted_levels_keep_best_within_capacity():
+    bid_cols = data_center.allocate_book_columns(2)
+    ask_cols = data_center.allocate_book_columns(2)
+    orderbook = dict(
+        bids=[["17", "1", 1], ["18", "1", 2], ["19", "1", 3]],
+        asks=[["23", "1", 1], ["22", "1", 2], ["21", "1", 3]],
+    )
+    bids, asks = kraken_client.parse_orderbook_into_columns(
+        orderbook, bid_cols, ask_cols
+    )
+    assert list(bids["price"]) == [19, 18]
+    assert list(asks["price"]) == [21, 22]
+    assert list(asks["timestamp"]) == [3, 2]
+
+
+def test_cached_response_counts_as_old(monkeypatch):
+    monkeypatch.setattr(
+        kraken_client, "get_orderbook", lambda **kwargs: (None, bid_arr, ask_arr)
+    )
+    monkeypatch.setattr(kraken_client, "get_server_time", lambda: (None, 1000))
+    center = data_center.DataCenter("X", load_trades=False, max_staleness=1)
+
+    monkeypatch.setattr(kraken_client, "last_response_age", lambda: 0.0)
+    assert center.get_market_data()["stale"] == ()
+    # served from the cache, fetched 3 seconds ago
+    monkeypatch.setattr(kraken_client, "last_response_age", lambda: 3.0)
+    market_data = center.get_market_data()
+    assert market_data["stale"] == ("order_book",)
+    assert market_data["timestamp"] - market_data["received"]["order_book"] > 1
+
+
+def test_multi_pair_passes_deadline_and_marks_skipped_ohlc_stale(monkeypatch):
+    quote = dict(a=["2", "1", "1"], b=["1", "1", "1"], c=["1.5", "1"])
+    deadlines = []
+    ohlc = np.zeros(1, dtype=kraken_client.OHLC_DTYPE)
+
+    def fake_ticker(pairs, deadline=None):
+        deadlines.append(deadline)
+        return kraken_client.parse_ticker_into_arr({"A": quote}, pairs)
+
+    def fake_ohlc(pair, interval=1, deadline=None):
+        deadlines.append(deadline)
+        return ohlc
+
+    monkeypatch.setattr(kraken_client, "get_ticker", fake_ticker)
+    monkeypatch.setattr(kraken_client, "get_ohlc", fake_ohlc)
+    monkeypatch.setattr(kraken_client, "get_server_time", lambda: (None, 1000))
+    center = data_center.MultiPairDataCenter(pairs=["A"])
+
+    deadline = time.monotonic() + 60
+    market_data = center.get_market_data(deadline=deadline)
+    assert deadlines == [deadline, deadline]
+    assert market_data["A"]["stale"] == ()
+
+    # deadline passed: the ohlc request is skipped, the old data is kept
+    market_data = center.get_market_data(deadline=time.monotonic() - 1)
+    assert len(deadlines) == 3
+    assert market_data["A"]["public_trades"].ohlc is ohlc
+    assert market_data["A"]["stale"] == ("public_trades",)
+
+
+def test_levels_parsed_into_buffers_and_sorted_in_place():
+    bid_cols = data_center.allocate_book_columns(4)
+    ask_cols = data_center.allocate_book_columns(4)
+    orderbook = dict(
+        bids=[["18", "1", 1], ["19", "2", 2], ["17", "3", 3]],
+        asks=[["21", "1", 1], ["22", "2", 2]],
+    )
+    bids, asks = kraken_client.parse_orderbook_into_columns(
+        orderbook, bid_cols, ask_cols
+    )
+    assert np.shares_memory(bids["price"], bid_cols["price"])
+    assert list(bids["price"]) == [19, 18, 17]
+    assert list(bids["volume"]) == [2, 1, 3]
+    assert list(asks["price"]) == [21, 22]
@@ -0,0 +1,87 @@
+import os
+import sys
+
+package_directory = f"{os.getcwd()}//src"
+sys.path.append(package_directory)
+
+import numpy as np
+import evaluation
+import kraken_client
+from data_center import OrderBook, PublicTrades
+from performance import StreamingPerformance
+from strategies import SobiStrategy
+
+
+def make_history(n, seed=0):
+    rng = np.random.default_rng(seed)
+    mids = 100 + np.cumsum(rng.normal(0, 0.2, n))
+    history = []
+    for i, mid in enumerate(mids):
+        bids = np.zeros(10, dtype=kraken_client.ORDERBOOK_DTYPE)
+        asks = np.zeros(10, dtype=kraken_client.ORDERBOOK_DTYPE)
+        bids["price"] = mid - 0.05 - np.arange(10) * 0.1
+        asks["price"] = mid + 0.05 + np.arange(10) * 0.1
+        bids["volume"] = rng.exponential(1, 10)
+        asks["volume"] = rng.exponential(1, 10)
+        ohlc = np.zeros(1, dtype=kraken_client.OHLC_DTYPE)
+        ohlc["close"] = mid + rng.normal(0, 0.1)
+        history.append(
+            dict(
+                time=f"t{i}",
+                timestamp=2.0 * i,
+                order_book=OrderBook(bids=bids, asks=asks),
+                public_trades=PublicTrades(ohlc=ohlc),
+            )
+        )
+    return history
+
+
+def test_block_bootstrap_resamples_contiguous_blocks():
+    pnl = np.arange(10, dtype=float)
+    samples = evaluation.block_bootstrap(pnl, block_size=5, n_resamples=100, seed=1)
+    assert samples.shape == (100, 10)
+    # every block is a run of consecutive values
+    assert np.all(np.diff(samples[:, :5], axis=1) == 1)
+    assert np.all(np.diff(samples[:, 5:], axis=1) == 1)
+
+    whole = evaluation.block_bootstrap(pnl, block_size=10, n_resamples=3)
+    assert np.all(whole == pnl)
+
+
+def test_walk_forward_report_independent_of_workers():
+    history = make_history(120)
+    param_grid = dict(
+        window_size=[3, 5],
+        theta=[0.05, 0.2],
+        depth=[30],
+        position_size=[1],
+        sleep_seconds=[0],
+    )
+    kwargs = dict(
+        train_size=40, test_size=20, warmup_size=10, n_resamples=200, batch_size=64
+    )
+    report = evaluation.evaluate(history, SobiStrategy, param_grid, **kwargs)
+    assert [w["test"] for w in report["windows"]] == [
+        (40, 60),
+        (60, 80),
+        (80, 100),
+        (100, 120),
+    ]
+    assert np.isclose(report["oos_pnl"], sum(w["test_pnl"] for w in report["windows"]))
+    assert 0 <= report["bootstrap"]["prob_loss"] <= 1
+
+    pooled = evaluation.evaluate(
+        history, SobiStrategy, param_grid, n_workers=2, **kwargs
+    )
+    assert pooled["windows"] == report["windows"]
+    assert pooled["bootstrap"] == report["bootstrap"]
+    assert "out of sample" in evaluation.format_report(report)
+
+
+def test_max_drawdown_matches_streaming_performance():
+    # equity curve that starts below zero
+    pnl = np.array([-2.0, -1.0, 0.5, -3.0, 4.0, -1.0])
+    performance = StreamingPerformance()
+    for equity in np.cumsum(pnl):
+        performance.on_tick(equity=equity, position=0)
+    assert evaluation.max_drawdown(pnl) == performance.max_drawdown == 3.5
@@ -0,0 +1,40 @@
+import os
+import sys
+package_directory = f"{os.getcwd()}//src"
+sys.path.append(package_directory)
+
+import numpy as np
+import kraken_client
+import main
+from backtest import Backtest
+from data_center import OrderBook
+from strategies import Strategy
+
+
+class FixedStrategy(Strategy):
+    def update_indicators(self):
+        pass
+
+    def update_signals(self):
+        self.trade_signal = 1
+
+
+def test_hold_position_on_stale_signal_inputs():
+    bids = np.array([(99, 1, 0)], dtype=kraken_client.ORDERBOOK_DTYPE)
+    asks = np.array([(100, 1, 0)], dtype=kraken_client.ORDERBOOK_DTYPE)
+    market_state = dict(
+        time="t0",
+        order_book=OrderBook(bids=bids, asks=asks),
+        public_trades=None,
+        stale=("public_trades",),
+    )
+    strategy = FixedStrategy(position_size=1, sleep_seconds=0)
+    strategy.trade_signal = -1
+    engine = Backtest()
+
+    # the book is fresh, but the signal is outdated
+    main.trade_on_market_state("X", strategy, engine, market_state)
+    assert engine.current_position == 0
+
+    main.trade_on_market_state("X", strategy, engine, dict(market_state, stale=()))
+    assert engine.current_position == 1
@@ -0,0 +1,121 @@
+import os
+import sys
+
+package_directory = f"{os.getcwd()}//src"
+sys.path.append(package_directory)
+
+import time
+import numpy as np
+import kraken_client
+import market_bus
+from backtest import Backtest
+from data_center import OrderBook, PublicTrades
+from simulator import KrakenStandIn, SyntheticMarket
+from strategies import SobiStrategy
+
+
+def test_publish_and_read_views():
+    bids = np.array([(19, 1, 0), (18, 2, 0)], dtype=kraken_client.ORDERBOOK_DTYPE)
+    asks = np.array([(21, 1, 0)], dtype=kraken_client.ORDERBOOK_DTYPE)
+    ohlc = np.zeros(3, dtype=kraken_client.OHLC_DTYPE)
+    ohlc["timestamp"], ohlc["close"] = [60, 120, 180], [1, 2, 3]
+    market_state = dict(
+        timestamp=180.0,
+        order_book=OrderBook(bids=bids, asks=asks),
+        public_trades=PublicTrades(ohlc=ohlc),
+    )
+
+    prefix = f"test{os.getpid()}"
+    publisher = market_bus.MarketDataPublisher(["X"], depth=5, n_ohlc=10, prefix=prefix)
+    subscriber = market_bus.MarketDataSubscriber(
+        ["X"], depth=5, n_ohlc=10, prefix=prefix
+    )
+    try:
+        assert not subscriber.wait_for_update("X", 0, timeout=0)
+        publisher.publish("X", market_state)
+        seq, state = subscriber.read("X")
+        assert seq == 2
+        assert state["order_book"].best_bid == 19
+        assert state["order_book"].obwa(side="bid", depth=100) == 55 / 3
+        assert state["public_trades"].last_price == 3
+
+        publisher.publish("X", market_state)
+        assert not subscriber.is_current("X", seq)
+        state = None
+    finally:
+        subscriber.close()
+        publisher.close()
+
+
+def test_publish_keeps_timestamps_of_components_not_refetched():
+    bids = np.array([(19, 1, 0)], dtype=kraken_client.ORDERBOOK_DTYPE)
+    asks = np.array([(21, 1, 0)], dtype=kraken_client.ORDERBOOK_DTYPE)
+    ohlc = np.zeros(1, dtype=kraken_client.OHLC_DTYPE)
+    market_state = dict(
+        timestamp=100.0,
+        order_book=OrderBook(bids=bids, asks=asks),
+        public_trades=PublicTrades(ohlc=ohlc),
+        received=dict(order_book=99.0, public_trades=100.0),
+        stale=(),
+    )
+
+    prefix = f"test{os.getpid()}"
+    publisher = market_bus.MarketDataPublisher(["X"], depth=5, n_ohlc=10, prefix=prefix)
+    subscriber = market_bus.MarketDataSubscriber(
+        ["X"], depth=5, n_ohlc=10, prefix=prefix
+    )
+    try:
+        publisher.publish("X", market_state)
+        # the book fetch failed: the old book is kept with its old time
+        new_bids = np.array([(5, 1, 0)], dtype=kraken_client.ORDERBOOK_DTYPE)
+        publisher.publish(
+            "X",
+            dict(
+                market_state,
+                timestamp=110.0,
+                order_book=OrderBook(bids=new_bids, asks=asks),
+                received=dict(order_book=99.0, public_trades=110.0),
+                stale=("order_book",),
+            ),
+        )
+        _, state = subscriber.read("X")
+        assert state["timestamp"] == 110.0
+        assert state["received"] == dict(order_book=99.0, public_trades=110.0)
+        assert state["stale"] == ("order_book",)
+        assert state["order_book"].best_bid == 19
+        state = None
+    finally:
+        subscriber.close()
+        publisher.close()
+
+
+def test_bus_workers_trade_against_stand_in(monkeypatch):
+    market = SyntheticMarket(start_price=100, seed=1)
+    # negative theta: always a buy signal
+    strategy = SobiStrategy(
+        window_size=1, theta=-1e9, depth=50, position_size=1, sleep_seconds=0
+    )
+    with KrakenStandIn({"SYNUSD": market}) as stand_in:
+        monkeypatch.setattr(kraken_client, "URL_PUBLIC", stand_in.url)
+        stop_event, processes, results = market_bus.start_bus(
+            {"SYNUSD": strategy},
+            {"SYNUSD": Backtest()},
+            depth=10,
+            sleep_seconds=0.05,
+            prefix=f"test{os.getpid()}",
+        )
+        collected = []
+        try:
+            deadline = time.monotonic() + 20
+            while time.monotonic() < deadline and not collected:
+                collected = market_bus.collect_results(results, timeout=1)
+        finally:
+            stop_event.set()
+            for process in processes:
+                process.join(timeout=5)
+
+    assert collected
+    assert collected[0]["pair"] == "SYNUSD"
+    assert collected[0]["position"] == 1
+    assert collected[0]["n_orders"] == 1
+    assert all(process.exitcode == 0 for process in processes)
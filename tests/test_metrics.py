@@ -0,0 +1,23 @@
+import os
+import sys
+package_directory = f"{os.getcwd()}//src"
+sys.path.append(package_directory)
+
+import metrics
+
+
+def test_render_prometheus_text():
+    registry = metrics.Registry()
+    requests = registry.counter("requests_total", "Requests")
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1))
+    requests.inc(endpoint="Depth")
+    requests.inc(endpoint="Depth")
+    latency.observe(0.5)
+    latency.observe(5)
+
+    text = registry.render()
+    assert 'requests_total{endpoint="Depth"} 2' in text
+    assert 'latency_seconds_bucket{le="0.1"} 0' in text
+    assert 'latency_seconds_bucket{le="1"} 1' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 2' in text
+    assert "latency_seconds_count 2" in text
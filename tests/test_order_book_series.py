@@ -0,0 +1,91 @@
+import os
+import sys
+
+package_directory = f"{os.getcwd()}//src"
+sys.path.append(package_directory)
+
+import numpy as np
+import kraken_client
+from data_center import OrderBook, PublicTrades
+from order_book_series import OrderBookSeries
+from strategies import SobiStrategy
+
+
+def random_order_book(rng):
+    mid = 100 + rng.normal()
+    n_bids, n_asks = rng.integers(1, 20, 2)
+    bids = np.zeros(n_bids, dtype=kraken_client.ORDERBOOK_DTYPE)
+    asks = np.zeros(n_asks, dtype=kraken_client.ORDERBOOK_DTYPE)
+    bids["price"] = mid - 0.5 - np.arange(n_bids) * 0.1
+    asks["price"] = mid + 0.5 + np.arange(n_asks) * 0.1
+    bids["volume"] = rng.exponential(1, n_bids)
+    asks["volume"] = rng.exponential(1, n_asks)
+    return OrderBook(bids=bids, asks=asks)
+
+
+def make_history(n, rng):
+    history = []
+    for i in range(n):
+        ohlc = np.zeros(1, dtype=kraken_client.OHLC_DTYPE)
+        ohlc["close"] = 100 + rng.normal()
+        history.append(
+            dict(
+                timestamp=float(i),
+                order_book=random_order_book(rng),
+                public_trades=PublicTrades(ohlc=ohlc),
+            )
+        )
+    return history
+
+
+def test_obwa_matches_order_book():
+    rng = np.random.default_rng(0)
+    order_books = [random_order_book(rng) for _ in range(50)]
+    series = OrderBookSeries.from_order_books(order_books)
+
+    obwa = series.obwa("ask", [1, 30, 70])
+    for i, order_book in enumerate(order_books):
+        for j, depth in enumerate([1, 30, 70]):
+            assert np.isclose(obwa[i, j], order_book.obwa(side="ask", depth=depth))
+    assert np.allclose(series.midprice, [ob.midprice for ob in order_books])
+
+
+def test_batch_signals_match_sequential_updates():
+    rng = np.random.default_rng(1)
+    history = make_history(30, rng)
+    kwargs = dict(window_size=5, theta=0.05, depth=30, position_size=1, sleep_seconds=0)
+
+    features = OrderBookSeries.from_history(history).features(depths=(30,))
+    signals = SobiStrategy(**kwargs).batch_signals(features)
+
+    strategy = SobiStrategy(**kwargs)
+    for i, market_state in enumerate(history):
+        strategy.update_market_state(current_state=market_state)
+        assert np.isclose(signals["imb_bid"][i], strategy.indicators["imb_bid"])
+        if i >= 4:
+            rolling_imb_ask = strategy.indicators["rolling_imb_ask"]
+            assert np.isclose(signals["rolling_imb_ask"][i], rolling_imb_ask)
+            assert signals["rolling"][i] == strategy.trade_signal
+
+
+def test_batch_signals_nan_only_affects_its_windows():
+    rng = np.random.default_rng(2)
+    history = make_history(12, rng)
+    # no trade price for one snapshot
+    history[2]["public_trades"].ohlc["close"] = np.nan
+    kwargs = dict(window_size=3, theta=0.05, depth=30, position_size=1, sleep_seconds=0)
+
+    features = OrderBookSeries.from_history(history).features(depths=(30,))
+    signals = SobiStrategy(**kwargs).batch_signals(features)
+
+    strategy = SobiStrategy(**kwargs)
+    for i, market_state in enumerate(history):
+        strategy.update_market_state(current_state=market_state)
+        if i >= 2:
+            rolling_imb_bid = strategy.indicators["rolling_imb_bid"]
+            assert np.isclose(
+                signals["rolling_imb_bid"][i], rolling_imb_bid, equal_nan=True
+            )
+            assert signals["rolling"][i] == strategy.trade_signal
+    assert np.isnan(signals["rolling_imb_bid"][2:5]).all()
+    assert not np.isnan(signals["rolling_imb_bid"][5:]).any()
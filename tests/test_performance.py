@@ -0,0 +1,51 @@
+import os
+import sys
+
+package_directory = f"{os.getcwd()}//src"
+sys.path.append(package_directory)
+
+import numpy as np
+import kraken_client
+from backtest import Backtest
+from data_center import OrderBook
+from performance import StreamingPerformance
+
+
+def test_streaming_statistics_match_batch():
+    rng = np.random.default_rng(0)
+    equity = np.cumsum(rng.normal(0.1, 1, 500))
+    performance = StreamingPerformance(periods_per_year=252)
+    for value in equity:
+        performance.on_tick(equity=value, position=1)
+
+    returns = np.diff(equity)
+    drawdown = np.maximum.accumulate(equity) - equity
+    assert np.isclose(performance.mean_return, returns.mean())
+    assert np.isclose(performance.variance, returns.var(ddof=1))
+    assert np.isclose(performance.max_drawdown, drawdown.max())
+    assert np.isclose(
+        performance.sharpe, returns.mean() / returns.std(ddof=1) * np.sqrt(252)
+    )
+    downside = np.sqrt(np.mean(np.minimum(returns, 0) ** 2))
+    assert np.isclose(performance.sortino, returns.mean() / downside * np.sqrt(252))
+
+
+def test_round_trips_and_exposure():
+    engine = Backtest()
+    prices = [100, 101, 103, 102, 103, 99, 99]
+    positions = [1, 1, 0, -1, -1, 0, 0]
+    for i, (price, position) in enumerate(zip(prices, positions)):
+        bids = np.array([(price - 0.5, 1, 0)], dtype=kraken_client.ORDERBOOK_DTYPE)
+        asks = np.array([(price + 0.5, 1, 0)], dtype=kraken_client.ORDERBOOK_DTYPE)
+        engine.update_market_state(
+            dict(time=f"t{i}", timestamp=10.0 * i, order_book=OrderBook(bids, asks))
+        )
+        engine.rebalance_position(position)
+
+    stats = engine.get_performance()
+    # long 100.5 -> 102.5 wins, short 101.5 -> 99.5 wins
+    assert (stats["wins"], stats["losses"]) == (2, 0)
+    assert stats["avg_holding_time"] == 20
+    assert stats["time_in_market"] == 40
+    assert np.isclose(stats["exposure"], 40 / 60)
+    assert np.isclose(stats["max_drawdown"], 2)
@@ -0,0 +1,71 @@
+import os
+import sys
+package_directory = f"{os.getcwd()}//src"
+sys.path.append(package_directory)
+
+import pickle
+import numpy as np
+import kraken_client
+import persistence
+from backtest import Backtest
+from data_center import OrderBook
+from strategies import SobiStrategy
+
+bids = np.array([(99, 1, 0)], dtype=kraken_client.ORDERBOOK_DTYPE)
+asks = np.array([(100, 1, 0)], dtype=kraken_client.ORDERBOOK_DTYPE)
+
+
+def make_strategy():
+    return SobiStrategy(
+        window_size=3, theta=0.1, depth=50, position_size=0.1, sleep_seconds=0
+    )
+
+
+def test_checkpoint_roundtrip(tmp_path):
+    strategy = make_strategy()
+    strategy.last_imbalances = [(1.0, 2.0), (1.5, 2.5)]
+    strategy.trade_signal = 1
+    engine = Backtest()
+    engine.update_market_state(dict(time="t0", order_book=OrderBook(bids, asks)))
+    engine.rebalance_position(0.1)
+
+    path = str(tmp_path / "checkpoint.bin")
+    persistence.save_checkpoint(path, strategy, engine)
+
+    new_strategy, new_engine = make_strategy(), Backtest()
+    assert persistence.load_checkpoint(path, new_strategy, new_engine)
+    assert new_strategy.last_imbalances == [(1.0, 2.0), (1.5, 2.5)]
+    assert new_strategy.trade_signal == 1
+    assert new_engine.current_position == 0.1
+    assert list(new_engine.cashflows) == [-10.0]
+    assert new_engine.total_cashflow == -10.0
+    assert new_engine.all_orders[0].trade_price == 100
+
+
+def test_load_history_keeps_latest_records(tmp_path):
+    path = str(tmp_path / "history.bin")
+    for i in range(5):
+        persistence.record_market_state(path, dict(time=i))
+
+    history = persistence.load_history(path, max_records=2)
+    assert [x["time"] for x in history] == [3, 4]
+
+
+def test_history_is_rotated_and_read_across_files(tmp_path):
+    path = str(tmp_path / "history.bin")
+    record_size = len(pickle.dumps(dict(time=0), protocol=persistence.PICKLE_PROTOCOL))
+    for i in range(10):
+        persistence.record_market_state(path, dict(time=i), max_bytes=3 * record_size)
+
+    # rotated after records 2, 5 and 8, only the last two files are kept
+    history = persistence.load_history(path)
+    assert [x["time"] for x in history] == [6, 7, 8, 9]
+    assert [x["time"] for x in persistence.load_history(path, max_records=2)] == [8, 9]
+
+
+def test_corrupt_checkpoint_falls_back_to_cold_start(tmp_path):
+    path = str(tmp_path / "checkpoint.bin")
+    with open(path, "wb") as f:
+        # pickled reference to a module that doesn't exist
+        f.write(b"\x80\x04cno_such_module\nState\n.")
+    assert not persistence.load_checkpoint(path, make_strategy(), Backtest())
@@ -0,0 +1,69 @@
+import os
+import sys
+package_directory = f"{os.getcwd()}//src"
+sys.path.append(package_directory)
+
+import profiling
+
+
+def test_timed_aggregates_calls():
+    registry = profiling.TimingRegistry(n_recent=4)
+
+    @profiling.timed(name="work", registry=registry)
+    def work(x):
+        return x * 2
+
+    for i in range(10):
+        assert work(i) == 2 * i
+    with profiling.timer("block", registry=registry):
+        pass
+
+    report = registry.report()
+    assert report["work"]["count"] == 10
+    assert report["block"]["count"] == 1
+    assert report["work"]["p99"] >= report["work"]["p50"] >= 0
+
+
+def test_loop_profiler_dumps_reports(tmp_path):
+    loop_profiler = profiling.LoopProfiler(output_dir=str(tmp_path), iterations=2)
+    loop_profiler.request("cprofile")
+    for _ in range(3):
+        with loop_profiler.iteration():
+            sum(range(1000))
+
+    assert not loop_profiler.active
+    suffixes = sorted(name.split("_cprofile")[-1] for name in os.listdir(tmp_path))
+    assert suffixes == [".prof", ".txt", "_timings.txt"]
+
+
+def test_report_since_snapshot_keeps_totals():
+    registry = profiling.TimingRegistry(n_recent=4)
+    for _ in range(3):
+        registry.record("work", 1.0)
+    start = registry.snapshot()
+    for _ in range(5):
+        registry.record("work", 2.0)
+
+    since = registry.report(since=start)["work"]
+    assert since["count"] == 5
+    assert since["mean"] == since["p50"] == 2.0
+    assert registry.report()["work"]["count"] == 8
+
+
+def test_timed_per_class_and_invalid_env(monkeypatch):
+    registry = profiling.TimingRegistry()
+
+    class Base:
+        @profiling.timed(registry=registry, per_class=True)
+        def run(self):
+            pass
+
+    class Sub(Base):
+        pass
+
+    Base().run()
+    Sub().run()
+    assert {f"{__name__}.Base.run", f"{__name__}.Sub.run"} <= set(registry.snapshot())
+
+    monkeypatch.setenv(profiling.ENV_PROFILE, "cprofile:many")
+    assert profiling.LoopProfiler()._requested is None
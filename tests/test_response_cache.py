@@ -0,0 +1,65 @@
+import os
+import sys
+package_directory = f"{os.getcwd()}//src"
+sys.path.append(package_directory)
+
+import time
+import threading
+from response_cache import ResponseCache
+
+
+def test_ttl_and_errors():
+    now = {"t": 0.0}
+    cache = ResponseCache(ttls={"Depth": 1}, time_fn=lambda: now["t"])
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        return {"error": [], "result": len(calls)}
+
+    assert cache.get_or_fetch("Depth", {"pair": "X"}, fetch)["result"] == 1
+    assert cache.get_or_fetch("Depth", {"pair": "X"}, fetch)["result"] == 1
+    assert cache.get_or_fetch("Depth", {"pair": "Y"}, fetch)["result"] == 2
+    now["t"] = 1.5
+    assert cache.get_or_fetch("Depth", {"pair": "X"}, fetch)["result"] == 3
+    assert cache.get_or_fetch("Time", None, lambda: {"error": ["down"]})["error"]
+    assert cache.get_or_fetch("Time", None, fetch)["result"] == 4
+    assert cache.stats == dict(hit=1, miss=5, coalesced=0)
+
+
+def test_concurrent_requests_are_coalesced():
+    cache = ResponseCache(ttls={})
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        time.sleep(0.2)
+        return {"error": [], "result": "book"}
+
+    results = []
+    threads = [
+        threading.Thread(
+            target=lambda: results.append(cache.get_or_fetch("Depth", {}, fetch))
+        )
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert len(results) == 4
+    assert cache.stats["coalesced"] == 3
+
+
+def test_age_of_cached_response():
+    now = {"t": 10.0}
+    cache = ResponseCache(ttls={"OHLC": 2}, time_fn=lambda: now["t"])
+    fetch = lambda: {"error": [], "result": 1}
+
+    cache.get_or_fetch("OHLC", {"pair": "X"}, fetch)
+    assert cache.last_age() == 0
+    now["t"] = 11.5
+    cache.get_or_fetch("OHLC", {"pair": "X"}, fetch)
+    assert cache.last_age() == 1.5
@@ -0,0 +1,38 @@
+import os
+import sys
+
+package_directory = f"{os.getcwd()}//src"
+sys.path.append(package_directory)
+
+from scheduler import Scheduler
+
+
+def test_overrun_skips_missed_slots():
+    now = [0.0]
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        now[0] += seconds
+
+    scheduler = Scheduler(interval_seconds=2, time_fn=lambda: now[0], sleep_fn=sleep)
+    assert scheduler.deadline == 2
+
+    now[0] += 0.5
+    assert scheduler.wait() == 0
+    assert now[0] == 2
+
+    # iteration takes 5s: slots starting at 4 and 6 are skipped
+    now[0] += 5
+    assert scheduler.wait() == 2
+    assert now[0] == 8
+    assert scheduler.missed_slots == 2
+    assert scheduler.deadline == 10
+
+
+def test_zero_interval_disables_pacing():
+    sleeps = []
+    scheduler = Scheduler(interval_seconds=0, sleep_fn=sleeps.append)
+    assert scheduler.deadline is None
+    assert scheduler.wait() == 0
+    assert sleeps == []
@@ -0,0 +1,30 @@
+import os
+import sys
+package_directory = f"{os.getcwd()}//src"
+sys.path.append(package_directory)
+
+import kraken_client
+from simulator import KrakenStandIn, SyntheticMarket
+
+
+def test_stand_in_serves_kraken_responses(monkeypatch):
+    market = SyntheticMarket(start_price=100, seed=1)
+    with KrakenStandIn({"SYNUSD": market}) as stand_in:
+        monkeypatch.setattr(kraken_client, "URL_PUBLIC", stand_in.url)
+        monkeypatch.setattr(kraken_client.RESPONSE_CACHE, "ttls", {})
+
+        failures = kraken_client.REQUEST_FAILURES.get(endpoint="Depth") or 0
+        _, server_time = kraken_client.get_server_time()
+        _, bids, asks = kraken_client.get_orderbook(pair="SYNUSD", count=10)
+        ohlc = kraken_client.get_ohlc(pair="SYNUSD")
+        ticker = kraken_client.get_ticker(["SYNUSD"])
+        unknown = kraken_client.send_public_request("Depth", {"pair": "NOPE"})
+
+    assert server_time > 0
+    assert len(bids) == len(asks) == 10
+    assert bids["price"][0] < asks["price"][0]
+    assert len(ohlc) == 720
+    assert ticker["bid"][0] < ticker["ask"][0]
+    assert unknown["error"] == ["EQuery:Unknown asset pair"]
+    # error payload with status 200 counts as failure
+    assert kraken_client.REQUEST_FAILURES.get(endpoint="Depth") == failures + 1